@@ -1,97 +1,129 @@
 import streamlit as st
 import pandas as pd
-import nvdbapiv3
 import altair as alt
 from shapely import wkt
 import folium
 from folium.plugins import Draw
 import streamlit_folium
 from streamlit_folium import st_folium
-from io import BytesIO
 from datetime import datetime
 from nvdbskred.kartfunksjoner import kart, create_point_map
-from nvdbskred.plotfunksjoner import plot, skred_type_counts, skred_type_by_month, style_function
+from nvdbskred.plotfunksjoner import plot, skred_type_counts, skred_type_by_month, style_function, skred_kube
+from nvdbskred.databehandling import fylker, last_skreddata, last_vegar, filtrer_utval, kontraktsomrader
+from nvdbskred.hurtigbuffer import Filterbuffer
+from nvdbskred.vegreferanse import vegstrekning
+from nvdbskred.posisjon import vegref_mange
+from nvdbskred.nedlaster import NedlastingsFeil
+from nvdbskred.eksport import eksportfil, skriv, FILENDING, MIME
+from nvdbskred.romindeks import teikningar
+from nvdbskred.tidtaking import steg, oppsamling, tidtabell
+from nvdbskred.analyse import skredpunkt, topp, skredpunktlag, BITLENGDER
+from nvdbskred import statistikk
+from nvdbskred.fliser import Fliseteneste, FLISER_PAA
+from nvdbskred.rutenett import RUTENETTGRENSE
+import os
+import time
+import uuid
+import shutil
+import hashlib
 import requests
 from pyproj import Transformer
 import json
 
-st.set_page_config(page_title='NVDB skreddata', page_icon=None, layout="centered", initial_sidebar_state="auto", menu_items=None)
+# Utval og kolonneuttak frå det delte datasettet blir visningar, og blir berre kopierte ved endring
+pd.set_option('mode.copy_on_write', True)
 
-fylker = {
-    "Agder": "42",
-    "Innlandet": "34",
-    "Møre og Romsdal": "15",
-    "Nordland": "18",
-    "Oslo": "03",
-    "Rogaland": "11",
-    "Troms og Finnmark": "54",
-    "Trøndelag": "50",
-    "Vestfold": "38",
-    "Vestland": "46",
-    "Viken": "30"
-    }
+st.set_page_config(page_title='NVDB skreddata', page_icon=None, layout="centered", initial_sidebar_state="auto", menu_items=None)
 
 def feilmelding():
     st.write('Feil oppstått, mest truleg feil vegreferanse. Prøv igjen med ny vegreferanse.')
 
-@st.cache_data
-def databehandling(filter):
-    skred = nvdbapiv3.nvdbFagdata(445)
-    skred.filter(filter)
-    #st.write(f'Antall skredregisteringar på strekninga: {skred.statistikk()["antall"]} stk')
-    #st.write(f'Total lengde registert for registerte skredhendingar: {int(skred.statistikk()["lengde"])} meter')
-    df = pd.DataFrame.from_records(skred.to_records())
-    df_utvalg = df[['Skred dato', 'Type skred', 'Volum av skredmasser på veg', 
-                    'Stedsangivelse', 'Løsneområde', 'Værforhold på vegen', 'Blokkert veglengde', 
-                    'geometri', 'vref']].copy() 
-    df_utvalg.columns = df_utvalg.columns.str.replace(' ', '_')
-    df_utvalg['Skred_dato'] = pd.to_datetime(df_utvalg['Skred_dato'], errors='coerce')
-    return df_utvalg
+@st.cache_resource
+def filterbuffer():
+    return Filterbuffer()
+
+def databehandling(filter, losneomrade, fradato, tildato):
+    framdrift = []
+    def oppdater(ferdige, totalt, delfilter, antall):
+        if not framdrift:
+            framdrift.append(st.progress(0.0, text='Hentar skreddata frå NVDB'))
+        framdrift[0].progress(ferdige / totalt, text=f'Henta {ferdige} av {totalt} delspørringar')
+    df_utvalg = last_skreddata(filter, losneomrade, fradato, tildato, buffer=filterbuffer(), fremdrift=oppdater)
+    for linje in framdrift:
+        linje.empty()
+    return df_utvalg.drop(columns=['nvdbId', 'fylke', 'kontraktsomrader'])
+
+def vegdatabehandling(filter, vegar, losneomrade, fradato, tildato):
+    # Fleire vegar samstundes, kvar veg blir svara frå bufferen når han er henta før
+    framdrift = st.progress(0.0, text='Hentar skreddata frå NVDB')
+    def oppdater(ferdige, totalt, veg, antall):
+        framdrift.progress(ferdige / totalt, text=f'Henta {veg} ({ferdige} av {totalt} vegar)')
+    df_utvalg = last_vegar(filter, vegar, losneomrade, fradato, tildato, buffer=filterbuffer(), fremdrift=oppdater)
+    framdrift.empty()
+    if df_utvalg.empty:
+        raise KeyError('Ingen skred på vegane')
+    return df_utvalg.drop(columns=['nvdbId', 'fylke', 'kontraktsomrader'])
 
 def filter_df(df, losneomrade, fradato, tildato):
-    filtered_df = df[(df['Skred_dato'] >= fradato) & 
-                 (df['Skred_dato'] <= tildato) & 
-                 (df['Løsneområde'].isin(losneomrade))]
-    return filtered_df
-
-def last_ned_excel(df):
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, sheet_name='Sheet1')
-    writer.save()
-    processed_data = output.getvalue()
-    return processed_data
+    return filtrer_utval(df, losneomrade, fradato, tildato)
 
 @st.cache_data
-def kontraktsfunksjon():
-    r = requests.get('https://nvdbapiles-v3.atlas.vegvesen.no/omrader/kontraktsomrader')
-    data = r.json()
-    return data
-
-def nedlasting(df):
-    return st.download_button(
-                "Last ned skredpunkt",
-                df.to_csv().encode("utf-8"),
-                "skredpunkt.csv",
-                "text/csv",
-                key="download-csv",
-            )
+def aggregering(filter, losneomrade, fradato, tildato, strekning, versjon, _df):
+    # Tabellen bak diagramma blir bufra per filter og dataversjon, datasettet sjølv blir ikkje hasha.
+    # Versjonen er ny kvar gong datasettet blir lasta, sjå databehandling._versjon.
+    return skred_kube(_df)
+
+@st.cache_data
+def skredpunktanalyse(filter, losneomrade, fradato, tildato, strekning, bitlengd, versjon, _df):
+    return skredpunkt(_df, bitlengd)
 
 @st.cache_data
-def vegref(nord, ost, maks_avstand=50, srid=4326):
-    r = requests.get(f"https://nvdbapiles-v3.atlas.vegvesen.no/posisjon?lat={nord}&lon={ost}&maks_avstand={maks_avstand}&maks_antall=1&srid={srid}")
-    data = r.json()
-    print(json.dumps(data[0], indent=4))
-    vegreferanse = {
-        'kortform' : data[0]['vegsystemreferanse']['kortform'],
-        'vegkategori' : data[0]['vegsystemreferanse']['vegsystem']['vegkategori'],
-        'fase' : data[0]['vegsystemreferanse']['vegsystem']['fase'],
-        'nummer' : data[0]['vegsystemreferanse']['vegsystem']['nummer'],
-        'strekning' : data[0]['vegsystemreferanse']['strekning']['strekning'],
-        'delstrekning' : data[0]['vegsystemreferanse']['strekning']['delstrekning'],
-        'meter' : data[0]['vegsystemreferanse']['strekning']['meter']
-    }
-    return vegreferanse
+def frekvensanalyse(filter, losneomrade, fradato, tildato, strekning, bitlengd, versjon, _df):
+    return statistikk.frekvens(_df, bitlengd, fradato, tildato)
+
+@st.cache_resource
+def fliseteneste():
+    # Éi flisteneste for heile appen, sjå NVDBSKRED_FLISEPORT og NVDBSKRED_FLISEURL
+    return Fliseteneste()
+
+@st.cache_data
+def kontraktsfunksjon():
+    return kontraktsomrader()
+
+NEDLASTINGSFORMAT = {'CSV': 'csv', 'Excel': 'xlsx', 'GeoPackage': 'gpkg', 'GeoParquet': 'geoparquet', 'DXF': 'dxf'}
+
+# Eksportfiler blir lagde under static/ og serverte av Streamlit frå disk (server.enableStaticServing)
+NEDLASTINGSMAPPE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'nedlasting')
+NEDLASTING_ALDER = 3600
+
+def nedlastingsfil(df, format):
+    # Skriv eksporten blokkvis til ei ny mappe med tilfeldig namn, og fjernar eldre filer
+    if os.path.isdir(NEDLASTINGSMAPPE):
+        for gammal in os.listdir(NEDLASTINGSMAPPE):
+            sti = os.path.join(NEDLASTINGSMAPPE, gammal)
+            if time.time() - os.path.getmtime(sti) > NEDLASTING_ALDER:
+                shutil.rmtree(sti, ignore_errors=True)
+    namn = uuid.uuid4().hex
+    os.makedirs(os.path.join(NEDLASTINGSMAPPE, namn))
+    with steg(f'eksport: {format}', rader=len(df)):
+        skriv(df, os.path.join(NEDLASTINGSMAPPE, namn, f'skredpunkt.{FILENDING[format]}'), format)
+    return f'app/static/nedlasting/{namn}/skredpunkt.{FILENDING[format]}'
+
+def eksportdata(df, format):
+    with eksportfil(df, format) as sti, open(sti, 'rb') as fil:
+        return fil.read()
+
+@st.fragment
+def nedlasting(df, format='csv'):
+    # Fila blir berre laga når brukaren ber om ho. Fragmentet køyrer åleine, så resten av sida står.
+    if not st.get_option('server.enableStaticServing'):
+        # Utan statisk servering går fila gjennom minnet til Streamlit
+        return st.download_button("Last ned skredpunkt", lambda: eksportdata(df, format), f"skredpunkt.{FILENDING[format]}",
+                                  MIME[format], key=f"download-{format}", on_click='ignore')
+    if st.button('Lag fil for nedlasting', key=f'eksport-{format}'):
+        url = nedlastingsfil(df, format)
+        st.markdown(f'<a href="{url}" download="skredpunkt.{FILENDING[format]}">Last ned skredpunkt</a>',
+                    unsafe_allow_html=True)
 
 st.title('NVDB skreddata')
 st.write('Henter data fra NVDB api v3, ved nedhenting av fylker og heile landet tek det ein del tid å hente data')
@@ -115,7 +147,7 @@ losneomrade = st.multiselect(
     ['Fjell/dalside', 'Vegskjæring'])
 
 
-referansevalg = st.radio('Velg vegreferanseinput', ['Landsdekkende', 'Kart', 'Vegreferanse'], horizontal=True)
+referansevalg = st.radio('Velg vegreferanseinput', ['Landsdekkende', 'Kart', 'Vegreferanse', 'Fleire vegar', 'Område i kart'], horizontal=True)
 
 if referansevalg == 'Kart':
     # Setter opp kartobjekt, med midtpunkt og zoom nivå
@@ -154,8 +186,7 @@ if referansevalg == 'Kart':
         #st.write(output["all_drawings"][0]["geometry"]["coordinates"])
         #st.write(output["all_drawings"][1]["geometry"]["coordinates"])
 
-        vegref1 = vegref(pos1[1], pos1[0])
-        vegref2 = vegref(pos2[1], pos2[0])
+        vegref1, vegref2 = vegref_mange([(pos1[1], pos1[0]), (pos2[1], pos2[0])])
         #st.write(f'Vegref1 : {vegref1}')
         #st.write(f'Vegref2 : {vegref2}')
 
@@ -177,6 +208,37 @@ if referansevalg == 'Kart':
         st.error('Markør må vere innan 30 meter fra veg, ved fleire nære vegar må din veg vere den nærmaste.')
     #st.write(output)
 
+if referansevalg == 'Område i kart':
+    st.write('Teikn linjer, polygon, rektangel eller punkt i kartet. Skred innanfor avstanden blir henta frå datasettet som er lasta, utan nye spørringar mot NVDB.')
+    avstand = st.number_input('Avstand frå teikna geometri (meter)', value=500, min_value=0, step=50)
+    m = folium.Map(location=[62.14497, 9.404296], zoom_start=5)
+    folium.raster_layers.WmsTileLayer(
+        url="https://opencache.statkart.no/gatekeeper/gk/gk.open_gmaps?layers=topo4&zoom={z}&x={x}&y={y}",
+        name="Norgeskart",
+        fmt="image/png",
+        layers="topo4",
+        attr='<a href="http://www.kartverket.no/">Kartverket</a>',
+        transparent=True,
+        overlay=True,
+        control=True,
+    ).add_to(m)
+    Draw(
+    draw_options={
+        'polyline': True,
+        'polygon': True,
+        'rectangle': True,
+        'circle': False,
+        'circlemarker': False,
+        'marker': True
+    }, position='topleft', filename='skredomrade.geojson', export=True,
+    ).add_to(m)
+    output = st_folium(m, width=700, height=500, key='omrade')
+    teikna = (output or {}).get('all_drawings') or []
+    if teikna:
+        referansetype = 'omrade'
+    else:
+        st.error('Teikn minst éin geometri i kartet.')
+
 if referansevalg == 'Vegreferanse':
     vegnummer = st.text_input('Vegnummer', 'Rv5')
     col1, col2 = st.columns(2)
@@ -195,6 +257,22 @@ if referansevalg == 'Vegreferanse':
         referansetype = 'delstrekning'
     nvdbfilter['vegsystemreferanse'] = vegreferanse
 
+if referansevalg == 'Fleire vegar':
+    st.write('Éi linje per veg. Delstrekning og meterverdi 0 gir heile vegen. Fylke og kontraktsområde under gjeld for alle vegane.')
+    vegtabell = st.data_editor(
+        pd.DataFrame({'Vegnummer': ['Rv5', 'Ev39'], 'Delstrekning fra': [0, 0], 'Meterverdi fra': [0, 0],
+                      'Delstrekning til': [0, 0], 'Meterverdi til': [0, 0]}),
+        num_rows='dynamic', hide_index=True, key='vegar')
+    vegar = []
+    for rad in vegtabell.dropna(subset=['Vegnummer']).itertuples(index=False):
+        fra_s, fra_m, til_s, til_m = (0 if pd.isna(v) else int(v) for v in rad[1:])
+        heile = fra_s == 0 and til_s == 0 and til_m == 0
+        vegar.append({'vegsystemreferanse': str(rad[0]).strip(), 'strekning': None if heile else (fra_s, fra_m, til_s, til_m)})
+    if vegar:
+        referansetype = 'vegar'
+    else:
+        st.error('Legg inn minst éin veg.')
+
 col_1, col_2 = st.columns(2)
 with col_1:
     fylkeboks = st.checkbox('Filtrer på fylker')
@@ -229,73 +307,117 @@ if vis_kart:
     karttype = st.radio('Vis kart med linjer eller punkter', ['Linjer', 'Punkter'])
     st.write('OBS! Punkter gir senterpunkt av linjene') 
 #st.write(nvdbfilter)  
+vis_skredpunkt = st.checkbox('Vis skredpunkt (vegbitar med flest skred)')
+if vis_skredpunkt:
+    col_bit, col_veg = st.columns(2)
+    with col_bit:
+        bitlengd = st.selectbox('Lengd på vegbit (m)', BITLENGDER, index=len(BITLENGDER) - 1)
+    with col_veg:
+        per_veg = st.number_input('Vegbitar per veg', min_value=1, max_value=50, value=5)
+vis_statistikk = st.checkbox('Vis frekvensstatistikk per vegsegment')
+if vis_statistikk:
+    SEGMENT = {'Heile strekningar': None, **{f'{lengd} m': lengd for lengd in BITLENGDER}}
+    segmentlengd = SEGMENT[st.selectbox('Segment', list(SEGMENT))]
+nedlastingsformat = st.selectbox('Format for nedlasting', list(NEDLASTINGSFORMAT))
 vis_data = st.button('Hent skreddata')
+vis_tidtaking = st.sidebar.checkbox('Vis tidtaking for stega')
 
 if vis_data:
-    try:
-        df_data = databehandling(nvdbfilter)
-        df_utvalg = filter_df(df_data, losneomrade, fradato, tildato)
+    with oppsamling() as maalingar:
+        try:
+            if referansetype == 'vegar':
+                df_data = vegdatabehandling(nvdbfilter, vegar, losneomrade, fradato, tildato)
+            else:
+                df_data = databehandling(nvdbfilter, losneomrade, fradato, tildato)
+            with st.sidebar.expander('Minnebruk for bufra datasett'):
+                st.dataframe(filterbuffer().oversikt(), hide_index=True)
+            df_utvalg = filter_df(df_data, losneomrade, fradato, tildato)
+            strekning = None
         
-        if referansetype == 'delstrekning':
-            #st.write('delstrekning')
-            #st.write(f'delstrekning fra {delstrekning_fra} til {delstrekning_til}')
-            #st.write(f'meterverdi fra {meterverdi_fra} til {meterverdi_til}')
-            # Extract segment as int
-            df_utvalg['segment'] = df_utvalg['vref'].str.extract(r'S(\d+)D\d+').astype(int)
-            df_utvalg[['start_distance', 'end_distance']] = df_utvalg['vref'].str.extract(r'm(\d+)-(\d+)')
-
-            # Convert the extracted distances to int
-            df_utvalg['start_distance'] = df_utvalg['start_distance'].astype(int)
-            df_utvalg['end_distance'] = df_utvalg['end_distance'].astype(int)
-
-            #Filtrerer ut for å få delstrekning basert på meterverdier
-            # condition1 = (df_utvalg['segment'] == int(delstrekning_fra)) & (df_utvalg['start_distance'] >= int(meterverdi_fra))
-            # condition2 = (df_utvalg['segment'] >= int(delstrekning_fra)) & (df_utvalg['segment'] <= int(delstrekning_til))
-            # condition3 = (df_utvalg['segment'] == int(delstrekning_til)) & (df_utvalg['end_distance'] <= int(meterverdi_til))
-            # condition1_df = df_utvalg[condition1]
-            # st.write(condition1_df)
-
-            # condition2_df = df_utvalg[condition2]
-            # st.write(condition2_df)
-
-            # condition3_df = df_utvalg[condition3]
-            # st.write(condition3_df)
-            # filtered_df = df_utvalg[condition1 | condition2 | condition3]
-
-
-            condition1 = (df_utvalg['segment'] == int(delstrekning_fra)) & (df_utvalg['start_distance'] >= int(meterverdi_fra))
-
-            # Rows where 'segment' is greater than 'delstrekning_fra' and less than 'delstrekning_til'
-            condition2 = (df_utvalg['segment'] > int(delstrekning_fra)) & (df_utvalg['segment'] < int(delstrekning_til))
-
-            # Rows where 'segment' is equal to 'delstrekning_til' and 'end_distance' is less than or equal to 'meterverdi_til'
-            condition3 = (df_utvalg['segment'] == int(delstrekning_til)) & (df_utvalg['end_distance'] <= int(meterverdi_til))
-
-            
-
-            # Combine the conditions
-            filtered_df = df_utvalg[condition1 | condition2 | condition3]
-            #st.write(df_utvalg['segment'])
-            #st.write(df_utvalg)
-            #st.write(filtered_df)
-
-        elif referansetype == 'enkel':
-            filtered_df = df_utvalg
-        else:
-            filtered_df = df_utvalg
-        nedlasting(filtered_df)
-
-        st.altair_chart(plot(filtered_df), use_container_width=True)
-        st.altair_chart(skred_type_counts(filtered_df), use_container_width=True)
-        st.altair_chart(skred_type_by_month(filtered_df), use_container_width=True)
-
-        if vis_kart:
-            if karttype == 'Punkter':
-                streamlit_folium.folium_static(create_point_map(filtered_df))
-            if karttype == 'Linjer':
-                kart(filtered_df)
-    except KeyError:
-        st.error('Feilmelding! Sjekk om det er motsetningar i filterkriterier, f.eks vegreferanse utanfor fylke, eller kontraktsområde.')
+            if referansetype == 'delstrekning':
+                # vref er tolka og datasettet sortert langs vegen ved innlesing, sjå klargjer_vref
+                strekning = (vegreferanse, delstrekning_fra, meterverdi_fra, delstrekning_til, meterverdi_til)
+                filtered_df = vegstrekning(df_utvalg, *strekning)
+
+            elif referansetype == 'omrade':
+                # Romleg søk i indeksen for det bufra datasettet, utan ny spørring mot NVDB
+                strekning = (json.dumps([f['geometry'] for f in teikna]), avstand)
+                indeks = filterbuffer().romindeks(nvdbfilter, losneomrade, fradato, tildato)
+                filtered_df = indeks.utval(df_utvalg, teikningar(teikna), avstand)
+
+            elif referansetype == 'vegar':
+                # Strekningane er alt avgrensa og slått saman i last_vegar
+                strekning = json.dumps(vegar)
+                filtered_df = df_utvalg
+
+            elif referansetype == 'enkel':
+                filtered_df = df_utvalg
+            else:
+                filtered_df = df_utvalg
+            nedlasting(filtered_df, NEDLASTINGSFORMAT[nedlastingsformat])
+
+            versjon = df_data.attrs.get('versjon')
+            kube = aggregering(nvdbfilter, losneomrade, fradato, tildato, strekning, versjon, filtered_df)
+            for diagram in [plot, skred_type_counts, skred_type_by_month]:
+                with steg(f'diagram: {diagram.__name__}'):
+                    st.altair_chart(diagram(kube), use_container_width=True)
+
+            if vis_skredpunkt:
+                # Rangert langs vegen for heile utvalet, sjå analyse.skredpunkt
+                punkt = topp(skredpunktanalyse(nvdbfilter, losneomrade, fradato, tildato, strekning, bitlengd, versjon, filtered_df), per_veg)
+                st.subheader('Skredpunkt')
+                st.dataframe(punkt.drop(columns=['midt_lat', 'midt_lon']), hide_index=True)
+                if not (vis_kart and karttype == 'Punkter'):
+                    # Eige kart når punktkartet ikkje blir vist, elles blir laget lagt over det
+                    punktkart_skred = folium.Map(location=[filtered_df['midt_lat'].mean(), filtered_df['midt_lon'].mean()], zoom_start=5)
+                    skredpunktlag(punkt).add_to(punktkart_skred)
+                    streamlit_folium.folium_static(punktkart_skred)
+
+            if vis_statistikk:
+                # Rekna éin gong for heile det bufra datasettet, her blir berre segmenta i utvalet viste.
+                # last_vegar bufrar kvar veg for seg, så då blir det samanslåtte datasettet brukt.
+                if referansetype == 'vegar':
+                    frekvens = frekvensanalyse(nvdbfilter, losneomrade, fradato, tildato, strekning, segmentlengd, versjon, df_data)
+                else:
+                    frekvens = filterbuffer().statistikk(nvdbfilter, losneomrade, fradato, tildato, segmentlengd)
+                if frekvens is not None:
+                    st.subheader('Frekvensstatistikk')
+                    fra_aar, til_aar = frekvens.attrs.get('aar', (None, None))
+                    st.caption(f'Skred per år, empirisk gjentaksintervall (år) og trend (skred per år per år, Sen) '
+                               f'med p-verdi frå Mann-Kendall, over {fra_aar}-{til_aar}.')
+                    st.dataframe(statistikk.utval(frekvens, filtered_df, segmentlengd, losneomrade).drop(columns=['segment']),
+                                 hide_index=True)
+                else:
+                    st.info('Fann ikkje eit bufra datasett å rekne frekvensstatistikk for.')
+
+            if vis_kart:
+                if karttype == 'Punkter':
+                    punktkart = create_point_map(filtered_df)
+                    if vis_skredpunkt:
+                        skredpunktlag(punkt).add_to(punktkart)
+                        folium.LayerControl().add_to(punktkart)
+                    with steg('kart: teikning', rader=len(filtered_df)):
+                        streamlit_folium.folium_static(punktkart)
+                if karttype == 'Linjer':
+                    if len(filtered_df) > RUTENETTGRENSE and FLISER_PAA:
+                        # Store utval blir henta som vektorfliser i staden for å liggje i sida,
+                        # når NVDBSKRED_FLISEURL og NVDBSKRED_FLISEPORT er sette
+                        nokkel = hashlib.sha1(json.dumps([nvdbfilter, losneomrade, str(fradato), str(tildato), strekning],
+                                                         default=str).encode()).hexdigest()[:16]
+                        kart(filtered_df, fliser=fliseteneste().registrer(nokkel, filtered_df))
+                    else:
+                        kart(filtered_df)
+        except (NedlastingsFeil, requests.RequestException):
+            st.error('Nedlastinga frå NVDB vart broten. Trykk på knappen igjen, så held nedlastinga fram frå der ho stoppa.')
+        except OSError:
+            st.error('Kunne ikkje lese eller skrive mellomlagra data på disk. Prøv igjen.')
+        except KeyError:
+            st.error('Feilmelding! Sjekk om det er motsetningar i filterkriterier, f.eks vegreferanse utanfor fylke, eller kontraktsområde.')
+        except ValueError:
+            feilmelding()
+    if vis_tidtaking:
+        with st.sidebar.expander('Tidtaking', expanded=True):
+            st.dataframe(tidtabell(maalingar), hide_index=True)
 
     
 st.divider()
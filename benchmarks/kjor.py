@@ -0,0 +1,205 @@
+"""Køyrer heile kjeda i appen mot stubserveren og tek tida på kvart steg.
+
+For kvar storleik blir stubserveren starta i ein eigen prosess med så mange objekt,
+og kjeda blir køyrd i ein ny prosess med tomt lager og tomme bufferar. Appen sine
+funksjonar blir køyrde i same rekkefølgje som i brukargrensesnittet: lager og
+nedlasting frå NVDB, klargjering, filter, strekningssøk, romleg utval, diagram,
+kart, eksport og posisjonsoppslag. Måla steg blir lagde til i resultatfila (utanfor git,
+benchmarks/resultat.jsonl om ikkje --resultat er gitt) saman med commit og tidspunkt,
+og samanlikna med førre køyring med same storleik.
+
+    python -m benchmarks.kjor
+    python -m benchmarks.kjor --antall 1000 10000 --opptak benchmarks/opptak.json
+    python -m benchmarks.kjor --resultat /tmp/resultat.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+MAPPE = os.path.dirname(os.path.abspath(__file__))
+RESULTAT = os.environ.get('NVDBSKRED_BENCHMARK_RESULTAT', os.path.join(MAPPE, 'resultat.jsonl'))
+PORT = int(os.environ.get('NVDBSKRED_BENCHMARK_PORT', 8765))
+STORLEIKAR = [1000, 10000, 100000]
+
+# Linjekartet blir bygd som GeoJSON i éin HTML-streng, over dette blir det hoppa over
+KARTRADER = 20000
+
+# Posisjonsoppslag per køyring, nye koordinatar kvar gong så bufferen ikkje svarar
+POSISJONAR = 200
+
+# Adressa blir lesen når nvdbskred blir importert, så ho må setjast først
+os.environ['NVDBSKRED_API'] = f'http://127.0.0.1:{PORT}'
+
+import requests
+import streamlit_folium
+from nvdbskred.tidtaking import steg, oppsamling
+from nvdbskred.databehandling import last_skreddata, filtrer_utval
+from nvdbskred.hurtigbuffer import Filterbuffer
+from nvdbskred.vegreferanse import vegstrekning
+from nvdbskred.romindeks import Romindeks
+from nvdbskred.plotfunksjoner import skred_kube, plot, skred_type_counts, skred_type_by_month
+from nvdbskred import kartfunksjoner
+from nvdbskred.kartfunksjoner import kart, create_point_map
+from nvdbskred.posisjon import vegref_mange
+from nvdbskred.eksport import eksportfil
+
+# Utan Streamlit blir kartet berre gjort om til HTML, som er det folium_static gjer før sending
+kartfunksjoner.streamlit_folium.folium_static = streamlit_folium.folium_static = lambda m, **_: m.get_root().render()
+
+
+def start_stub(antall, opptak=None):
+    argv = [sys.executable, '-m', 'benchmarks.stubserver', '--antall', str(antall), '--port', str(PORT)]
+    if opptak:
+        argv += ['--opptak', opptak]
+    prosess = subprocess.Popen(argv, cwd=os.path.dirname(MAPPE), stdout=subprocess.DEVNULL)
+    for _ in range(600):
+        try:
+            requests.get(f'{os.environ["NVDBSKRED_API"]}/omrader/fylker', timeout=1).raise_for_status()
+            return prosess
+        except requests.RequestException:
+            if prosess.poll() is not None:
+                raise RuntimeError('Stubserveren stoppa ved oppstart')
+            time.sleep(0.5)
+    prosess.kill()
+    raise RuntimeError('Stubserveren svarte ikkje')
+
+
+def kjede():
+    # Same steg som appen, med filter som gir treff i dei syntetiske dataa.
+    # Landsdekkande går via lageret, som blir bygd ved første kall, vegfilteret går rett mot NVDB.
+    df = last_skreddata({})
+    last_skreddata({'vegsystemreferanse': 'Ev'})
+
+    buffer = Filterbuffer()
+    buffer.legg_til({}, df)
+    with steg('buffer: fylke') as post:
+        post['rader'] = len(buffer.hent({'fylke': '46'}))
+
+    utval = filtrer_utval(df, ['Fjell/dalside', 'Ur'], datetime(2000, 1, 1), datetime(2020, 12, 31))
+
+    vanlegast = df['vegnummer'].groupby([df['vegkategori'], df['vegnummer']], observed=True).size().idxmax()
+    vegstrekning(df, f'{vanlegast[0]}v{vanlegast[1]}', 1, 0, 10, 5000)
+
+    with steg('romindeks: bygg', rader=len(df)):
+        indeks = Romindeks(df)
+    midt = df['geometry'].iloc[len(df) // 2].centroid
+    indeks.utval(df, midt, 20000)
+
+    kube = skred_kube(utval)
+    for diagram in [plot, skred_type_counts, skred_type_by_month]:
+        with steg(f'diagram: {diagram.__name__}'):
+            diagram(kube).to_dict()
+
+    punktkart = create_point_map(utval)
+    with steg('kart: teikning', rader=len(utval)):
+        streamlit_folium.folium_static(punktkart)
+    if len(utval) <= KARTRADER:
+        kart(utval)
+
+    for format in ['csv', 'gpkg', 'geoparquet']:
+        with steg(f'eksport: {format}'):
+            with eksportfil(utval, format):
+                pass
+
+    tilfeldig = random.Random()
+    punkt = [(tilfeldig.uniform(58, 71), tilfeldig.uniform(5, 30)) for _ in range(POSISJONAR)]
+    with steg('posisjon', rader=POSISJONAR):
+        vegref_mange(punkt)
+
+
+def samle(maalingar):
+    # Steg som blir køyrde fleire gonger (delspørringar) blir summerte
+    steg = {}
+    for post in maalingar:
+        samla = steg.setdefault(post['steg'], {'steg': post['steg'], 'sekund': 0.0, 'gonger': 0, 'rader': None})
+        samla['sekund'] = round(samla['sekund'] + post['sekund'], 4)
+        samla['gonger'] += 1
+        if post.get('rader') is not None:
+            samla['rader'] = max(samla['rader'] or 0, post['rader'])
+    return list(steg.values())
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=MAPPE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def forrige(antall, resultatfil=RESULTAT):
+    # Siste køyring med same storleik i resultatfila
+    if not os.path.exists(resultatfil):
+        return {}
+    with open(resultatfil, encoding='utf-8') as f:
+        postar = [json.loads(linje) for linje in f if linje.strip()]
+    postar = [p for p in postar if p['antall'] == antall]
+    if not postar:
+        return {}
+    siste = max(p['tid'] for p in postar)
+    return {p['steg']: p for p in postar if p['tid'] == siste}
+
+
+def rapport(antall, resultat, tidlegare):
+    print(f'\n{antall} objekt')
+    print(f'{"steg":<30}{"sekund":>10}{"førre":>10}{"endring":>10}{"rader":>10}')
+    for post in resultat:
+        forre = tidlegare.get(post['steg'], {}).get('sekund')
+        endring = f'{(post["sekund"] / forre - 1) * 100:+.0f} %' if forre else ''
+        rader = '' if post['rader'] is None else post['rader']
+        print(f'{post["steg"]:<30}{post["sekund"]:>10.3f}{forre if forre is not None else "":>10}{endring:>10}{rader:>10}')
+
+
+def kjor_kjede(antall, opptak=None):
+    # Stub og kjede i kvar sin prosess, så nedlastinga ikkje deler GIL med serveren
+    stub = start_stub(antall, opptak)
+    try:
+        with tempfile.TemporaryDirectory(prefix='nvdbskred-benchmark-') as mappe:
+            ut = os.path.join(mappe, 'maalingar.json')
+            env = {**os.environ, 'NVDBSKRED_LAGER': os.path.join(mappe, 'lager')}
+            subprocess.run([sys.executable, '-m', 'benchmarks.kjor', '--kjede', ut], cwd=os.path.dirname(MAPPE),
+                           env=env, check=True)
+            with open(ut, encoding='utf-8') as f:
+                return json.load(f)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--antall', type=int, nargs='+', default=STORLEIKAR)
+    parser.add_argument('--opptak', help='JSON-fil med opptekne objekt frå stubserver --ta-opp')
+    parser.add_argument('--resultat', default=RESULTAT, help='Fila resultatet blir lagt til i og samanlikna med')
+    parser.add_argument('--ikkje-lagre', action='store_true', help='Ikkje legg resultatet til i resultatfila')
+    parser.add_argument('--kjede', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.kjede:
+        # Barneprosessen: køyr kjeda mot stubserveren som alt køyrer, og skriv målingane
+        with oppsamling() as maalingar:
+            with steg('heile kjeda'):
+                kjede()
+        with open(args.kjede, 'w', encoding='utf-8') as f:
+            json.dump(samle(maalingar), f, ensure_ascii=False)
+        return
+
+    felles = {'tid': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit(),
+              'kjelde': os.path.basename(args.opptak) if args.opptak else 'syntetisk'}
+    for antall in args.antall:
+        resultat = kjor_kjede(antall, args.opptak)
+        rapport(antall, resultat, forrige(antall, args.resultat))
+        if not args.ikkje_lagre:
+            with open(args.resultat, 'a', encoding='utf-8') as f:
+                for post in resultat:
+                    f.write(json.dumps({**felles, 'antall': antall, **post}, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
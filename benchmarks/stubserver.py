@@ -0,0 +1,241 @@
+"""Lokal stand-in for NVDB-endepunkta appen bruker, for benchmark utan nettverk.
+
+Serverar /vegobjekter/445 (med paginering og filter på fylke, vegsystemreferanse og
+kontraktsomrade), /posisjon, /omrader/kontraktsomrader, /omrader/fylker og
+/vegobjekttyper/445. Objekta er syntetiske og deterministiske, eller tekne opp frå
+NVDB med --ta-opp og spelte av att med nye id-ar til ønskt tal objekt.
+
+    python -m benchmarks.stubserver --antall 10000 --port 8765
+    python -m benchmarks.stubserver --ta-opp benchmarks/opptak.json --fylke 46
+"""
+import re
+import json
+import random
+import argparse
+import threading
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+
+SIDESTORLEIK = 1000
+
+# Kortform frå NVDB og vegfilteret i spørringa, som i nvdbskred.vegreferanse
+KORTFORM = re.compile(r'^([ERFKPS])([VAPF])(\d+)\s*S(\d+)', re.IGNORECASE)
+VEGFILTER = re.compile(r'^\s*([ERFKPS])([VAPF])?\s*(\d+)?\s*(?:S(\d+)(?:\s*-\s*(\d+))?)?', re.IGNORECASE)
+
+FYLKER = [3, 11, 15, 18, 30, 34, 38, 42, 46, 50, 54]
+VEGKATEGORIAR = ['E', 'R', 'F', 'K', 'P', 'S']
+KONTRAKTER = [f'{9100 + i} Kontrakt {i}' for i in range(40)]
+
+EGENSKAPAR = {
+    'Skred dato': (2321, None),
+    'Type skred': (2326, ['Stein', 'Is/stein', 'Jord/løsmasse', 'Flomskred (vann+stein+jord)', 'Is', 'Snø',
+                          'Sørpeskred (vann+snø+stein)']),
+    'Volum av skredmasser på veg': (2327, ['< 3 m3', '3 - 10 m3', '10 - 100 m3', '> 100 m3', 'Ukjent']),
+    'Stedsangivelse': (2324, None),
+    'Løsneområde': (10243, ['Fjell/dalside', 'Vegskjæring', 'Ur', 'Inne i tunnel', 'Tunnelmunning (historisk)']),
+    'Værforhold på vegen': (2329, ['Regn', 'Snø', 'Tørt', 'Ukjent']),
+    'Blokkert veglengde': (2330, None),
+}
+
+
+def lag_objekt(nvdbid):
+    # Syntetisk skredobjekt med 1-2 vegsegment, same id gir alltid same objekt
+    tilfeldig = random.Random(nvdbid)
+    fylke = tilfeldig.choice(FYLKER)
+    kategori = tilfeldig.choice(VEGKATEGORIAR)
+    nummer = tilfeldig.randint(1, 999)
+    strekning = tilfeldig.randint(1, 20)
+    x, y = tilfeldig.uniform(-50000, 950000), tilfeldig.uniform(6450000, 7900000)
+    egenskapar = []
+    for navn, (eid, verdiar) in EGENSKAPAR.items():
+        if navn == 'Skred dato':
+            verdi = f'{tilfeldig.randint(1990, 2024)}-{tilfeldig.randint(1, 12):02d}-{tilfeldig.randint(1, 28):02d}'
+        elif navn == 'Stedsangivelse':
+            verdi = tilfeldig.choice(['Ved tunnel', 'Ved bru', 'Fri veg'])
+        elif navn == 'Blokkert veglengde':
+            verdi = tilfeldig.randint(0, 500)
+        else:
+            verdi = tilfeldig.choice(verdiar)
+        egenskapar.append({'id': eid, 'navn': navn, 'verdi': verdi})
+    segment = []
+    for delstrekning in range(1, tilfeldig.randint(1, 2) + 1):
+        meter = tilfeldig.randint(0, 9000)
+        punkt = ', '.join(f'{x + 10 * i:.3f} {y + 7 * i:.3f} {100 + i:.1f}' for i in range(tilfeldig.randint(2, 12)))
+        segment.append({
+            'fylke': fylke,
+            'geometri': {'wkt': f'LINESTRING Z ({punkt})', 'srid': 5973},
+            'vegsystemreferanse': {'kortform': f'{kategori}V{nummer} S{strekning}D{delstrekning} m{meter}-{meter + 80}'},
+        })
+    return {
+        'id': nvdbid,
+        'href': f'/vegobjekter/445/{nvdbid}',
+        'metadata': {'type': {'id': 445, 'navn': 'Skred'}, 'versjon': 1},
+        'egenskaper': egenskapar,
+        'lokasjon': {'kontraktsområder': [{'navn': tilfeldig.choice(KONTRAKTER)}]},
+        'vegsegmenter': segment,
+    }
+
+
+class Kjelde:
+    # Objekta serveren gir ut, syntetiske eller frå eit opptak som blir gjentatt med nye id-ar.
+    # Kvart objekt blir koda til JSON éin gong, og filtera blir svara frå ein liten indeks.
+    def __init__(self, antall, opptak=None):
+        postar = []
+        if opptak:
+            with open(opptak, encoding='utf-8') as f:
+                postar = json.load(f)
+        self.json = []
+        self.indeks = []
+        for nummer in range(antall):
+            if postar:
+                objekt = {**postar[nummer % len(postar)], 'id': 100000000 + nummer}
+            else:
+                objekt = lag_objekt(100000000 + nummer)
+            segment = objekt.get('vegsegmenter', [])
+            self.json.append(json.dumps(objekt, ensure_ascii=False))
+            self.indeks.append((
+                {str(s.get('fylke')).zfill(2) for s in segment},
+                [KORTFORM.match(s.get('vegsystemreferanse', {}).get('kortform', '')) for s in segment],
+                {k['navn'] for k in objekt.get('lokasjon', {}).get('kontraktsområder', [])},
+            ))
+        self.treffliste = lru_cache(maxsize=256)(self._treffliste)
+
+    def _treffliste(self, filter):
+        filter = dict(filter)
+        fylke = filter['fylke'].zfill(2) if 'fylke' in filter else None
+        veg = VEGFILTER.match(filter.get('vegsystemreferanse', ''))
+        kontrakt = filter.get('kontraktsomrade')
+        return [nummer for nummer, (fylker, kortformer, kontrakter) in enumerate(self.indeks)
+                if (fylke is None or fylke in fylker)
+                and (veg is None or any(self._paa_veg(k, veg) for k in kortformer))
+                and (kontrakt is None or kontrakt in kontrakter)]
+
+    @staticmethod
+    def _paa_veg(kortform, veg):
+        # Vegkategori, fase, vegnummer og strekningsintervall som i NVDB, det som manglar i filteret tel ikkje
+        if kortform is None:
+            return False
+        kategori, fase, nummer, fra, til = veg.groups()
+        if kortform[1].upper() != kategori.upper() or (fase and kortform[2].upper() != fase.upper()):
+            return False
+        if nummer and int(kortform[3]) != int(nummer):
+            return False
+        return not fra or int(fra) <= int(kortform[4]) <= int(til or fra)
+
+    def side(self, filter, start, antall):
+        # JSON for neste side med treff frå posisjon start
+        treff = self.treffliste(tuple(sorted(filter.items())))[start:start + antall]
+        return [self.json[nummer] for nummer in treff]
+
+
+class Handsamar(BaseHTTPRequestHandler):
+    kjelde = None
+
+    def log_message(self, *args):
+        pass
+
+    def svar(self, data, status=200):
+        innhald = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(innhald)))
+        self.end_headers()
+        self.wfile.write(innhald)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        sti = url.path.rstrip('/')
+        if sti == '/vegobjekter/445':
+            self.vegobjekter(params)
+        elif sti == '/posisjon':
+            self.posisjon(params)
+        elif sti == '/omrader/kontraktsomrader':
+            self.svar([{'navn': navn, 'nummer': 9100 + i, 'fylker': [FYLKER[i % len(FYLKER)]]}
+                       for i, navn in enumerate(KONTRAKTER)])
+        elif sti == '/omrader/fylker':
+            self.svar([{'nummer': fylke, 'navn': f'Fylke {fylke}'} for fylke in FYLKER])
+        elif sti == '/vegobjekttyper/445':
+            self.svar({'id': 445, 'navn': 'Skred', 'egenskapstyper': [
+                {'id': eid, 'navn': navn, 'tillatte_verdier': [{'id': eid * 100 + i, 'verdi': v} for i, v in enumerate(verdiar or [])]}
+                for navn, (eid, verdiar) in EGENSKAPAR.items()]})
+        else:
+            self.svar({'feil': f'Ukjent endepunkt {sti}'}, 404)
+
+    def vegobjekter(self, params):
+        start = int(params.pop('start', 0))
+        antall = int(params.pop('antall', SIDESTORLEIK))
+        filter = {k: v for k, v in params.items() if k in ('fylke', 'vegsystemreferanse', 'kontraktsomrade')}
+        objekter = self.kjelde.side(filter, start, antall)
+        neste = start + len(objekter)
+        query = '&'.join(f'{k}={quote(v)}' for k, v in params.items())
+        metadata = {
+            'returnert': len(objekter),
+            'sidestørrelse': antall,
+            'neste': {'start': str(neste),
+                      'href': f'http://{self.headers["Host"]}/vegobjekter/445?{query}&antall={antall}&start={neste}'},
+        }
+        # Objekta er ferdig koda, så svaret blir sett saman som tekst
+        innhald = f'{{"objekter": [{", ".join(objekter)}], "metadata": {json.dumps(metadata, ensure_ascii=False)}}}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(innhald.encode('utf-8'))))
+        self.end_headers()
+        self.wfile.write(innhald.encode('utf-8'))
+
+    def posisjon(self, params):
+        tilfeldig = random.Random(f'{params.get("lat")},{params.get("lon")}')
+        strekning, meter = tilfeldig.randint(1, 20), tilfeldig.randint(0, 9000)
+        self.svar([{'vegsystemreferanse': {
+            'kortform': f'EV39 S{strekning}D1 m{meter}',
+            'vegsystem': {'vegkategori': 'E', 'fase': 'V', 'nummer': 39},
+            'strekning': {'strekning': strekning, 'delstrekning': 1, 'meter': meter},
+        }, 'avstand': tilfeldig.uniform(0, 20)}])
+
+
+def start(antall, port=0, opptak=None):
+    # Startar serveren i ein bakgrunnstråd og gir (server, base-URL)
+    handsamar = type('Handsamar', (Handsamar,), {'kjelde': Kjelde(antall, opptak)})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handsamar)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def ta_opp(sti, filter, maks=2000):
+    # Tek opp ekte 445-objekt frå NVDB til ei JSON-fil som stubben kan spele av
+    from nvdbskred.nedlaster import NVDB_API, lag_sesjon, hent_side
+    sesjon = lag_sesjon()
+    url, params = f'{NVDB_API}/vegobjekter/445', {**filter, 'inkluder': 'metadata,egenskaper,lokasjon,vegsegmenter'}
+    objekter = []
+    while url and len(objekter) < maks:
+        data = hent_side(sesjon, url, params)
+        objekter += data.get('objekter', [])
+        url, params = (data['metadata']['neste']['href'], None) if data['metadata'].get('returnert') else (None, None)
+    with open(sti, 'w', encoding='utf-8') as f:
+        json.dump(objekter[:maks], f, ensure_ascii=False)
+    return len(objekter[:maks])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--antall', type=int, default=10000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--opptak', help='JSON-fil med opptekne objekt som blir spelte av')
+    parser.add_argument('--ta-opp', help='Ta opp objekt frå NVDB til denne fila og avslutt')
+    parser.add_argument('--fylke', help='Fylke for opptaket')
+    args = parser.parse_args()
+    if args.ta_opp:
+        print(ta_opp(args.ta_opp, {'fylke': args.fylke} if args.fylke else {}), 'objekt tekne opp')
+        return
+    server, url = start(args.antall, args.port, args.opptak)
+    print(f'Stubserver for NVDB på {url}, sett NVDBSKRED_API={url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
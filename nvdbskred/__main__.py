@@ -0,0 +1,151 @@
+import sys
+import json
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from nvdbskred.databehandling import fylker, kontraktsomrader, last_skreddata, filtrer_utval, synkroniser
+from nvdbskred.hurtigbuffer import Filterbuffer
+from nvdbskred.vegreferanse import vegstrekning
+from nvdbskred.eksport import skriv, filformat
+
+logger = logging.getLogger('nvdbskred')
+
+# Jobbar som køyrer samstundes, kvar jobb hentar i tillegg delspørringane sine parallelt
+MAKS_JOBBAR = 2
+
+ALLE = '*'
+
+
+def nvdbfilter(jobb):
+    # Same filter som appen sender til NVDB
+    filter = {}
+    if jobb.get('fylke'):
+        filter['fylke'] = fylker.get(jobb['fylke'], str(jobb['fylke']).zfill(2))
+    if jobb.get('kontraktsomrade'):
+        filter['kontraktsomrade'] = jobb['kontraktsomrade']
+    if jobb.get('vegsystemreferanse'):
+        filter['vegsystemreferanse'] = jobb['vegsystemreferanse']
+    return filter
+
+
+def _filnamn(tekst):
+    return ''.join('_' if teikn in '/\\:*?"<>|' else teikn for teikn in str(tekst))
+
+
+def utvid(jobbar):
+    # "kontraktsomrade": "*" blir éin jobb per kontraktsområde, avgrensa til fylket om det er gitt
+    utvida = []
+    kontrakter = None
+    for jobb in jobbar:
+        if jobb.get('kontraktsomrade') != ALLE:
+            utvida.append(jobb)
+            continue
+        if '{kontraktsomrade}' not in jobb['fil']:
+            raise ValueError(f'Utfila må innehalde {{kontraktsomrade}} når kontraktsomrade er "{ALLE}"')
+        if kontrakter is None:
+            kontrakter = kontraktsomrader()
+        fylke = nvdbfilter(jobb).get('fylke')
+        for kontrakt in kontrakter:
+            if fylke and int(fylke) not in kontrakt.get('fylker', []):
+                continue
+            ny = {**jobb, 'kontraktsomrade': kontrakt['navn']}
+            if fylke:
+                # Som i appen: fylket avgrensar berre kva kontraktar som er med
+                ny.pop('fylke', None)
+            ny['fil'] = jobb['fil'].format(kontraktsomrade=_filnamn(kontrakt['navn']))
+            utvida.append(ny)
+    return utvida
+
+
+def les_jobbfil(sti):
+    # Jobbfila er ei liste med jobbar, eller {"standard": {...}, "jobbar": [...]}
+    with open(sti, encoding='utf-8') as f:
+        innhald = json.load(f)
+    if isinstance(innhald, list):
+        innhald = {'jobbar': innhald}
+    standard = innhald.get('standard', {})
+    return [{**standard, **jobb} for jobb in innhald['jobbar']]
+
+
+def kjor_jobb(jobb, buffer):
+    filter = nvdbfilter(jobb)
+    losneomrade = jobb.get('losneomrade')
+    fradato, tildato = jobb.get('fradato'), jobb.get('tildato')
+    df = last_skreddata(filter, losneomrade, fradato, tildato, buffer=buffer)
+    df = filtrer_utval(df, losneomrade, fradato, tildato)
+    if jobb.get('strekning'):
+        # [fra_strekning, fra_meter, til_strekning, til_meter] på vegsystemreferansen
+        df = vegstrekning(df, filter.get('vegsystemreferanse'), *jobb['strekning'])
+    skriv(df, jobb['fil'], jobb.get('format'))
+    return len(df)
+
+
+def kjor(jobbar, maks_jobbar=MAKS_JOBBAR, fra_lager=False):
+    # Køyrer jobbane og gir talet på jobbar som feila
+    if not jobbar:
+        return 0
+    buffer = Filterbuffer()
+    if fra_lager:
+        # Alle jobbane blir svara ved lokal filtrering av heile lageret
+        buffer.legg_til({}, last_skreddata({}))
+    feila = 0
+    with ThreadPoolExecutor(max_workers=maks_jobbar) as pool:
+        jobbliste = {pool.submit(kjor_jobb, jobb, buffer): jobb for jobb in jobbar}
+        for jobb in as_completed(jobbliste):
+            fil = jobbliste[jobb]['fil']
+            try:
+                logger.info('%s: %d rader', fil, jobb.result())
+            except Exception:
+                logger.exception('%s: feila', fil)
+                feila += 1
+    return feila
+
+
+def argument():
+    parser = argparse.ArgumentParser(
+        prog='python -m nvdbskred',
+        description='Hent skreddata (vegobjekttype 445) frå NVDB og skriv til Parquet, GeoParquet, GeoPackage, CSV, Excel eller DXF.')
+    parser.add_argument('jobbfil', nargs='?', help='JSON-fil med jobbar, i staden for filteret under')
+    parser.add_argument('-o', '--fil', help='Utfil, formatet blir valt etter filending (.parquet, .geoparquet, .gpkg, .csv, .xlsx, .dxf)')
+    parser.add_argument('--fylke', help='Fylkesnamn eller fylkesnummer')
+    parser.add_argument('--kontraktsomrade', help=f'Kontraktsområde, "{ALLE}" gir éin fil per kontraktsområde')
+    parser.add_argument('--vegsystemreferanse', help='F.eks Rv5 eller Fv53S2-4')
+    parser.add_argument('--fradato', help='ÅÅÅÅ-MM-DD')
+    parser.add_argument('--tildato', help='ÅÅÅÅ-MM-DD')
+    parser.add_argument('--losneomrade', action='append', help='Kan gjentakast, utan blir alle tekne med')
+    parser.add_argument('--jobbar', type=int, default=MAKS_JOBBAR, help='Jobbar som køyrer samstundes')
+    parser.add_argument('--lager', action='store_true',
+                        help='Svar alle jobbane frå det lokale lageret i staden for eigne spørringar mot NVDB')
+    parser.add_argument('--synk', action='store_true', help='Oppdater det lokale lageret før jobbane')
+    return parser
+
+
+def main(argv=None):
+    parser = argument()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.jobbfil:
+        jobbar = les_jobbfil(args.jobbfil)
+    elif args.fil:
+        jobbar = [{k: getattr(args, k) for k in ['fil', 'fylke', 'kontraktsomrade', 'vegsystemreferanse',
+                                                 'fradato', 'tildato', 'losneomrade']}]
+    elif args.synk:
+        jobbar = []
+    else:
+        parser.error('Gi ei jobbfil eller ei utfil med -o')
+
+    try:
+        jobbar = utvid(jobbar)
+        for jobb in jobbar:
+            filformat(jobb['fil'], jobb.get('format'))
+    except (ValueError, KeyError) as feil:
+        parser.error(str(feil))
+
+    if args.synk:
+        logger.info('Synkroniserer lokalt lager: %s', synkroniser())
+    return 1 if kjor(jobbar, args.jobbar, args.lager) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
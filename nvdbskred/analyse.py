@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import folium
+from nvdbskred.vegreferanse import UKJEND_POSISJON, _NUMMER, _STREKNING, vegnamn
+from nvdbskred.tidtaking import tidtatt
+
+# Lengd på kvar bit av vegen i meter
+BITLENGDER = [100, 1000]
+
+# Talet på bitar i det glidande vindauget, midt på biten som blir rangert
+VINDAUGE = 3
+
+# Vekt per volumklasse, større skred tel meir
+VOLUMVEKT = {'< 3 m3': 1.0, '3 - 10 m3': 2.0, '10 - 100 m3': 4.0, '> 100 m3': 8.0}
+
+# Største tal på skredpunkt som blir teikna i kartet, dei med høgast vekt først
+KARTPUNKT = 500
+
+# Blokkert veglengde legg til éi vekt per så mange meter
+BLOKKERT_METER = 100
+
+KOLONNER = ['veg', 'strekning', 'fra_meter', 'til_meter', 'antall', 'vekt', 'antall_vindauge', 'vekt_vindauge',
+            'rang', 'midt_lat', 'midt_lon']
+
+
+def vekter(df):
+    # Volumklasse gongar med 1 + blokkert lengd / BLOKKERT_METER, ukjende verdiar gir vekt 1
+    volum = df['Volum_av_skredmasser_på_veg'].astype(object).map(VOLUMVEKT).fillna(1.0).to_numpy(np.float64)
+    blokkert = df['Blokkert_veglengde'].astype(np.float64).fillna(0).clip(lower=0).to_numpy()
+    return volum * (1 + blokkert / BLOKKERT_METER)
+
+
+@tidtatt('skredpunkt')
+def skredpunkt(df, bitlengd=1000, vindauge=VINDAUGE):
+    # Deler kvar veg i bitar langs vegposisjonen (strekning og meter, sjå klargjer_vref)
+    # og tel og vektar hendingane per bit. Glidande sum over vindauge bitar rundt kvar
+    # bit, og rang per veg etter vekta i vindauget. Heile landet i eitt pass med NumPy.
+    posisjon = df['vegposisjon'].to_numpy()
+    kjent = posisjon != UKJEND_POSISJON
+    midt = (posisjon[kjent] + df['vegposisjon_til'].to_numpy()[kjent]) // 2
+    if not len(midt):
+        return pd.DataFrame(columns=KOLONNER)
+    vekt = vekter(df)[kjent]
+
+    # Bitnummer er unike over heile landet fordi strekningane ligg _STREKNING meter frå kvarandre
+    bit, invers = np.unique(midt // bitlengd, return_inverse=True)
+    antall = np.bincount(invers)
+    bitvekt = np.bincount(invers, weights=vekt)
+    lat = np.bincount(invers, weights=df['midt_lat'].to_numpy(np.float64)[kjent]) / antall
+    lon = np.bincount(invers, weights=df['midt_lon'].to_numpy(np.float64)[kjent]) / antall
+
+    # Glidande sum med kumulative summar, vindauget blir avgrensa til same strekning
+    halv = vindauge // 2
+    strekning = bit * bitlengd // _STREKNING
+    fra = np.maximum(np.searchsorted(bit, bit - halv, side='left'),
+                     np.searchsorted(strekning, strekning, side='left'))
+    til = np.minimum(np.searchsorted(bit, bit + halv, side='right'),
+                     np.searchsorted(strekning, strekning, side='right'))
+    kum_antall, kum_vekt = np.r_[0, np.cumsum(antall)], np.r_[0, np.cumsum(bitvekt)]
+    antall_vindauge = kum_antall[til] - kum_antall[fra]
+    vekt_vindauge = kum_vekt[til] - kum_vekt[fra]
+
+    # Rang innanfor vegen: sorter på veg, så fallande vekt, og tel frå starten av vegen
+    veg = strekning * _STREKNING // _NUMMER
+    rekkefolgje = np.lexsort((-antall_vindauge, -vekt_vindauge, veg))
+    start = np.searchsorted(veg[rekkefolgje], veg[rekkefolgje], side='left')
+    rang = np.empty(len(bit), dtype=np.int64)
+    rang[rekkefolgje] = np.arange(len(bit)) - start + 1
+
+    meter = bit * bitlengd % _STREKNING
+    return pd.DataFrame({
+        'veg': vegnamn(veg),
+        'strekning': (strekning % (_NUMMER // _STREKNING)).astype(np.int32),
+        'fra_meter': meter.astype(np.int32),
+        'til_meter': (meter + bitlengd).astype(np.int32),
+        'antall': antall.astype(np.int32),
+        'vekt': bitvekt.round(2),
+        'antall_vindauge': antall_vindauge.astype(np.int32),
+        'vekt_vindauge': vekt_vindauge.round(2),
+        'rang': rang,
+        'midt_lat': lat,
+        'midt_lon': lon,
+    }).iloc[rekkefolgje].reset_index(drop=True)
+
+
+def topp(punkt, per_veg=5):
+    # Dei verste bitane per veg, sortert etter vekt over heile landet
+    return punkt[punkt['rang'] <= per_veg].sort_values('vekt_vindauge', ascending=False, ignore_index=True)
+
+
+def skredpunktlag(punkt, namn='Skredpunkt'):
+    # Sirklar over kartet, storleik etter vekta i vindauget
+    lag = folium.FeatureGroup(name=namn)
+    punkt = punkt.dropna(subset=['midt_lat', 'midt_lon']).nlargest(KARTPUNKT, 'vekt_vindauge')
+    storst = punkt['vekt_vindauge'].max() if len(punkt) else 1
+    for rad in punkt.itertuples(index=False):
+        folium.CircleMarker(
+            location=[rad.midt_lat, rad.midt_lon],
+            radius=4 + 16 * rad.vekt_vindauge / storst,
+            color='#d7301f',
+            fill=True,
+            fill_opacity=0.5,
+            tooltip=f'{rad.veg} S{rad.strekning} m{rad.fra_meter}-{rad.til_meter}: {rad.antall_vindauge} skred, vekt {rad.vekt_vindauge}',
+        ).add_to(lag)
+    return lag
@@ -0,0 +1,634 @@
+import os
+import glob
+import json
+import time
+import shutil
+import threading
+import contextvars
+from array import array
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import requests
+from nvdbskred.nedlaster import NVDB_API, les_sider, _laas
+from nvdbskred.skjema import KODELISTER, bruk_skjema
+from nvdbskred.vegreferanse import klargjer_vref, tolk_vegfilter, vegstrekning
+from nvdbskred.geometri import klargjer_geometri
+from nvdbskred.tidtaking import tidtatt
+
+SKREDOBJEKT = 445
+
+fylker = {
+    "Agder": "42",
+    "Innlandet": "34",
+    "Møre og Romsdal": "15",
+    "Nordland": "18",
+    "Oslo": "03",
+    "Rogaland": "11",
+    "Troms og Finnmark": "54",
+    "Trøndelag": "50",
+    "Vestfold": "38",
+    "Vestland": "46",
+    "Viken": "30"
+    }
+
+# Alle vegkategoriar, slik at oppdelinga ikkje mister skred på kommunal- og privatveg
+VEGKATEGORIAR = ['Ev', 'Rv', 'Fv', 'Kv', 'Pv', 'Sv']
+
+MAKS_TRAADER = int(os.environ.get('NVDBSKRED_TRAADER', 8))
+
+# Vegar som blir henta samstundes i last_vegar, kvar veg hentar i tillegg delspørringane sine parallelt
+MAKS_VEGAR = int(os.environ.get('NVDBSKRED_VEGAR', 4))
+
+# Eitt objekt gir ei rad per vegsegment, og kan kome med i fleire delspørringar
+NOKKEL = ['nvdbId', 'vref']
+
+KOLONNER = ['Skred dato', 'Type skred', 'Volum av skredmasser på veg',
+            'Stedsangivelse', 'Løsneområde', 'Værforhold på vegen', 'Blokkert veglengde',
+            'geometri', 'vref']
+
+# Egenskapane appen bruker, resten blir ikkje lagra ved innlesing
+EGENSKAPAR = ['Skred dato', 'Type skred', 'Volum av skredmasser på veg', 'Stedsangivelse',
+              'Løsneområde', 'Værforhold på vegen', 'Blokkert veglengde']
+
+# Kodelister med få ulike verdiar blir lagra som kategoriar
+KATEGORISKE = ['Type skred', 'Volum av skredmasser på veg', 'Løsneområde', 'Værforhold på vegen']
+
+# Relasjonar og eigengeometri på objektet blir ikkje henta, vegsegmenta har geometrien
+INKLUDER = 'metadata,egenskaper,lokasjon,vegsegmenter'
+
+# Lokalt lager for heile 445-datasettet, kan overstyrast med miljøvariabel
+LAGERMAPPE = os.environ.get('NVDBSKRED_LAGER', os.path.join(os.path.expanduser('~'), '.nvdbskred'))
+
+# Sidene i ei nedlasting som er i gang, slik at ho kan halde fram etter brot
+SJEKKPUNKTMAPPE = os.path.join(LAGERMAPPE, 'sjekkpunkt')
+
+# Objekt som er sletta i NVDB kjem ikkje med i endret_etter-spørringar,
+# så lageret blir bygd heilt på nytt med dette intervallet
+FULL_SYNK = timedelta(days=7)
+
+# Margin mot klokkeforskjell mellom oss og NVDB ved inkrementell synk
+SYNK_MARGIN = timedelta(minutes=10)
+
+# Låsfila for lageret blir fornya av ein bakgrunnstråd medan synken går, så ein lås som
+# ikkje er fornya på så lenge, høyrer til ein prosess som er stoppa
+LAGERLAAS_ALDER = timedelta(minutes=2)
+LAAS_PAUSE = 1
+
+
+class _Kodeliste:
+    # Ordbokkoda kolonne, lagrar kvar ulike verdi éin gong
+    def __init__(self):
+        self.kodar = array('i')
+        self.verdiar = {}
+
+    def append(self, verdi):
+        if verdi is None:
+            self.kodar.append(-1)
+        else:
+            self.kodar.append(self.verdiar.setdefault(verdi, len(self.verdiar)))
+
+    def til_array(self):
+        kodar = np.frombuffer(self.kodar, dtype=np.intc) if len(self.kodar) else np.array([], dtype=np.intc)
+        return pd.Categorical.from_codes(kodar, categories=list(self.verdiar))
+
+
+class Kolonnebuffer:
+    # Samlar vegsegmenta side for side i typa kolonner i staden for ei liste med dict
+    def __init__(self):
+        self.kolonner = {
+            'nvdbId': array('q'),
+            'fylke': array('h'),
+            'Blokkert veglengde': array('d'),
+            'kontraktsomrader': _Kodeliste(),
+        }
+        for navn in KATEGORISKE:
+            self.kolonner[navn] = _Kodeliste()
+        for navn in ['Skred dato', 'Stedsangivelse', 'geometri', 'vref']:
+            self.kolonner[navn] = []
+
+    def legg_til(self, objekt):
+        egenskapar = {eg['navn']: eg.get('verdi') for eg in objekt.get('egenskaper', [])
+                      if eg['navn'] in EGENSKAPAR}
+        kontrakter = ';'.join(k['navn'] for k in objekt.get('lokasjon', {}).get('kontraktsområder', []))
+        blokkert = egenskapar.get('Blokkert veglengde')
+        for seg in objekt.get('vegsegmenter', []):
+            if 'geometri' not in seg:
+                continue
+            k = self.kolonner
+            k['nvdbId'].append(objekt['id'])
+            k['fylke'].append(seg.get('fylke', 0))
+            k['Blokkert veglengde'].append(float('nan') if blokkert is None else float(blokkert))
+            k['kontraktsomrader'].append(kontrakter or None)
+            for navn in KATEGORISKE + ['Skred dato', 'Stedsangivelse']:
+                k[navn].append(egenskapar.get(navn))
+            k['geometri'].append(seg['geometri']['wkt'])
+            k['vref'].append(seg.get('vegsystemreferanse', {}).get('kortform'))
+
+    def til_frame(self):
+        data = {}
+        for navn, kolonne in self.kolonner.items():
+            if isinstance(kolonne, _Kodeliste):
+                data[navn] = kolonne.til_array()
+            elif isinstance(kolonne, array):
+                data[navn] = np.frombuffer(kolonne, dtype=kolonne.typecode).copy() if len(kolonne) else np.array([], dtype=kolonne.typecode)
+            else:
+                data[navn] = kolonne
+        return pd.DataFrame(data)
+
+
+def _tolk_side(objekter):
+    buffer = Kolonnebuffer()
+    for objekt in objekter:
+        buffer.legg_til(objekt)
+    return buffer.til_frame()
+
+
+@tidtatt('delspørring')
+def hent_objekt(filter, sjekkpunktmappe=SJEKKPUNKTMAPPE):
+    # Les side for side, og held berre éi side med rå JSON i minnet om gongen.
+    # Ferdige sider blir lagra som sjekkpunkt, så eit nytt kall held fram der det stoppa.
+    sider = les_sider(f'vegobjekter/{SKREDOBJEKT}', {**filter, 'inkluder': INKLUDER}, _tolk_side,
+                      sjekkpunktmappe=sjekkpunktmappe)
+    if not sider:
+        return _tolk_side([])
+    return slaa_saman(sider)
+
+
+def slaa_saman(frames):
+    # pd.concat gjer kategoriar med ulike verdiar om til object, så vi samkøyrer kategoriane først
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    for kolonne in frames[0].columns:
+        if isinstance(frames[0][kolonne].dtype, pd.CategoricalDtype):
+            verdiar = pd.api.types.union_categoricals([df[kolonne] for df in frames if kolonne in df]).categories
+            frames = [df.assign(**{kolonne: df[kolonne].cat.set_categories(verdiar)}) if kolonne in df else df
+                      for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+@lru_cache(maxsize=1)
+def fylkesinndeling():
+    r = requests.get(f'{NVDB_API}/omrader/fylker', timeout=30)
+    r.raise_for_status()
+    return tuple(str(fylke['nummer']).zfill(2) for fylke in r.json())
+
+
+def fylkesnummer():
+    # Fylkesinndelinga endrar seg, så vi spør NVDB (éin gong) og fell tilbake på fylker-oppslaget
+    try:
+        return list(fylkesinndeling())
+    except (requests.RequestException, ValueError, KeyError):
+        return list(fylker.values())
+
+
+def kontraktsomrader():
+    r = requests.get(f'{NVDB_API}/omrader/kontraktsomrader', timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+
+def del_opp(filter):
+    # Deler opp spørringa i uavhengige delspørringar per fylke og vegkategori
+    if 'fylke' in filter or 'kontraktsomrade' in filter:
+        fylkesliste = [None]
+    else:
+        fylkesliste = fylkesnummer()
+    if 'vegsystemreferanse' in filter:
+        kategoriar = [None]
+    else:
+        kategoriar = VEGKATEGORIAR
+
+    delfilter = []
+    for fylke in fylkesliste:
+        for kategori in kategoriar:
+            f = dict(filter)
+            if fylke is not None:
+                f['fylke'] = fylke
+            if kategori is not None:
+                f['vegsystemreferanse'] = kategori
+            delfilter.append(f)
+    return delfilter
+
+
+def hent_parallelt(filter, maks_traader=MAKS_TRAADER, fremdrift=None):
+    # Hentar delspørringane på ein avgrensa trådpool og slår saman resultatet.
+    # fremdrift(ferdige, totalt, delfilter, antall) blir kalla frå kallande tråd.
+    delfilter = del_opp(filter)
+    resultat = []
+    with ThreadPoolExecutor(max_workers=maks_traader) as pool:
+        # Kvar delspørring køyrer i ein kopi av konteksten, så tidtakinga ser ho
+        jobbar = {pool.submit(contextvars.copy_context().run, hent_objekt, f): f for f in delfilter}
+        for ferdige, jobb in enumerate(as_completed(jobbar), start=1):
+            df = jobb.result()
+            resultat.append(df)
+            if fremdrift:
+                fremdrift(ferdige, len(delfilter), jobbar[jobb], len(df))
+    df = slaa_saman(resultat)
+    if df.empty:
+        return df
+    return df.drop_duplicates(subset=NOKKEL, ignore_index=True)
+
+
+@lru_cache(maxsize=1)
+def skredtype_definisjon():
+    r = requests.get(f'{NVDB_API}/vegobjekttyper/{SKREDOBJEKT}', timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+
+def _egenskapstype(definisjon, navn):
+    for eg in definisjon['egenskapstyper']:
+        if eg['navn'] == navn:
+            return eg
+    raise KeyError(navn)
+
+
+def egenskapsfilter(losneomrade=None, fradato=None, tildato=None):
+    # Lagar NVDB egenskap-uttrykk av dato- og løsneområdefilteret, slik at
+    # utvalet blir gjort i NVDB. Gir None om datakatalogen ikkje kan brukast.
+    try:
+        definisjon = skredtype_definisjon()
+        dato = _egenskapstype(definisjon, 'Skred dato')
+        losne = _egenskapstype(definisjon, 'Løsneområde')
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+    uttrykk = []
+    if fradato:
+        uttrykk.append(f"egenskap({dato['id']})>={str(fradato)[:10]}")
+    if tildato:
+        uttrykk.append(f"egenskap({dato['id']})<={str(tildato)[:10]}")
+    if losneomrade:
+        verdiar = {v['verdi']: v['id'] for v in losne.get('tillatte_verdier', [])}
+        # Ukjende verdiar eller alle verdiar valt: løsneområde blir filtrert lokalt
+        if set(losneomrade) < set(verdiar):
+            ledd = [f"egenskap({losne['id']})={verdiar[verdi]}" for verdi in losneomrade]
+            uttrykk.append('(' + ' OR '.join(ledd) + ')')
+    if not uttrykk:
+        return None
+    return ' AND '.join(uttrykk)
+
+
+def kodelister():
+    # Tillatne verdiar frå datakatalogen, tom om han ikkje kan lesast
+    try:
+        definisjon = skredtype_definisjon()
+        return {kolonne: [v['verdi'] for v in _egenskapstype(definisjon, navn).get('tillatte_verdier', [])]
+                for kolonne, navn in KODELISTER.items()}
+    except (requests.RequestException, ValueError, KeyError):
+        return {}
+
+
+@tidtatt('nedlasting')
+def hent_skreddata(filter, losneomrade=None, fradato=None, tildato=None, fremdrift=None):
+    # Dato og løsneområde blir sendt med til NVDB. Filtreringa i appen blir
+    # framleis gjort etterpå, og tek over om NVDB ikkje godtek uttrykket.
+    uttrykk = egenskapsfilter(losneomrade, fradato, tildato)
+    if uttrykk:
+        try:
+            return hent_parallelt({**filter, 'egenskap': uttrykk}, fremdrift=fremdrift)
+        except requests.HTTPError:
+            pass
+    return hent_parallelt(filter, fremdrift=fremdrift)
+
+
+@tidtatt('klargjer')
+def klargjer(df):
+    # Plukkar ut kolonnene appen bruker, pluss id, fylke og kontraktsområde som lager og buffer treng
+    if df.empty:
+        df = pd.DataFrame(columns=['nvdbId', 'fylke', 'kontraktsomrader'] + KOLONNER)
+    df_utvalg = df[['nvdbId', 'fylke', 'kontraktsomrader'] + KOLONNER].copy()
+    df_utvalg.columns = df_utvalg.columns.str.replace(' ', '_')
+    df_utvalg['Skred_dato'] = pd.to_datetime(df_utvalg['Skred_dato'], errors='coerce')
+    return bruk_skjema(df_utvalg, kodelister())
+
+
+def _skredmappe(mappe):
+    return os.path.join(mappe, 'skred')
+
+
+def _metafil(mappe):
+    return os.path.join(mappe, 'synk.json')
+
+
+def _les_meta(mappe):
+    try:
+        with open(_metafil(mappe), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _skriv_meta(mappe, meta):
+    tmp = _metafil(mappe) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=4)
+    os.replace(tmp, _metafil(mappe))
+
+
+def _aar(df):
+    # Partisjonsnøkkel, 0 for hendingar utan gyldig dato
+    return df['Skred_dato'].dt.year.fillna(0).astype(int)
+
+
+def _partisjonsmappe(mappe, fylke, aar):
+    return os.path.join(_skredmappe(mappe), f'fylke={fylke}', f'aar={aar}')
+
+
+def _skriv_partisjonar(mappe, df, partisjonar):
+    # Skriv om berre dei oppgitte (fylke, år)-partisjonane. Tomme partisjonar blir sletta.
+    df = df.assign(aar=_aar(df))
+    grupper = dict(list(df.groupby(['fylke', 'aar'])))
+    for fylke, aar in partisjonar:
+        sti = _partisjonsmappe(mappe, fylke, aar)
+        del_df = grupper.get((fylke, aar))
+        if del_df is None or del_df.empty:
+            shutil.rmtree(sti, ignore_errors=True)
+            continue
+        os.makedirs(sti, exist_ok=True)
+        tmp = os.path.join(sti, 'del.parquet.tmp')
+        del_df.drop(columns=['fylke', 'aar']).to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(sti, 'del.parquet'))
+
+
+def _partisjonar(df):
+    if df.empty:
+        return set()
+    return set(zip(df['fylke'].astype(int), _aar(df)))
+
+
+def _les_partisjonar(filter=None, mappe=LAGERMAPPE):
+    sti = _skredmappe(mappe)
+    if not os.path.isdir(sti):
+        return None
+    filtre = None
+    if filter and 'fylke' in filter:
+        filtre = [('fylke', '=', int(filter['fylke']))]
+    df = pd.read_parquet(sti, filters=filtre)
+    # Partisjonskolonner kjem tilbake som kategoriar
+    df['fylke'] = df['fylke'].astype(int)
+    return bruk_skjema(df.drop(columns=['aar']).reset_index(drop=True))
+
+
+def _arrowtekst(tabell):
+    # pandas lagrar ikkje lagringstypen til strengkolonner, utan dette blir dei
+    # lesne tilbake som Python-strengar og kopierte ut av den delte fila
+    meta = tabell.schema.pandas_metadata
+    for kolonne in meta['columns']:
+        if kolonne['numpy_type'] == 'string':
+            kolonne['numpy_type'] = 'string[pyarrow]'
+    return tabell.replace_schema_metadata({**tabell.schema.metadata, b'pandas': json.dumps(meta).encode()})
+
+
+def _publiser(mappe, meta):
+    # Skriv heile lageret som ukomprimert Arrow IPC-fil, sortert langs vegen. Fila blir
+    # minnekartlagd ved lesing, så alle prosessar på maskina deler dei same sidene i staden
+    # for kvar sin kopi. Kvar synk får nytt filnamn, sidan ei fil som er kartlagd ikkje kan
+    # erstattast på alle system.
+    df = _les_partisjonar(mappe=mappe)
+    namn = None
+    if df is not None:
+        df = klargjer_vref(df)
+        namn = f"skred-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.arrow"
+        tabell = _arrowtekst(pa.Table.from_pandas(df, preserve_index=False))
+        with pa.OSFile(os.path.join(mappe, namn), 'wb') as fil:
+            with pa.ipc.new_file(fil, tabell.schema) as skrivar:
+                skrivar.write_table(tabell)
+    meta['delt'] = namn
+
+
+def _rydd_delt(mappe, meta):
+    # Fjernar alle delte filer som synk.json ikkje peikar på, også frå synkar som stoppa
+    # før dei var ferdige. Ei fil som er kartlagd i ein annan prosess blir ståande på
+    # system som ikkje tillet det, og blir fjerna ved neste synk.
+    for sti in glob.glob(os.path.join(mappe, 'skred-*.arrow')):
+        if os.path.basename(sti) != meta.get('delt'):
+            try:
+                os.remove(sti)
+            except OSError:
+                pass
+
+
+def les_delt(filter=None, mappe=LAGERMAPPE):
+    # Datasettet frå den delte Arrow-fila. Tekstkolonnene peikar rett inn i den
+    # minnekartlagde fila, berre kategorikodar og tal utan manglande verdiar blir kopierte.
+    meta = _les_meta(mappe)
+    if not meta or not meta.get('delt'):
+        return None
+    try:
+        tabell = pa.ipc.open_file(pa.memory_map(os.path.join(mappe, meta['delt']))).read_all()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    if filter and 'fylke' in filter:
+        tabell = tabell.filter(pc.equal(tabell['fylke'], int(filter['fylke'])))
+    return tabell.to_pandas(split_blocks=True)
+
+
+@tidtatt('les_lager')
+def les_lager(filter=None, mappe=LAGERMAPPE):
+    df = les_delt(filter, mappe)
+    if df is None:
+        df = _les_partisjonar(filter, mappe)
+    return df
+
+
+@contextmanager
+def _lagerlaas(mappe):
+    # Lås på tvers av prosessar for lageret, så berre éin prosess synkroniserer om gongen.
+    # Dei andre ventar, og finn eit ferskt lager når låsen blir frigjort.
+    laas = _laas(os.path.join(mappe, 'synk'), LAGERLAAS_ALDER)
+    while laas is None:
+        time.sleep(LAAS_PAUSE)
+        laas = _laas(os.path.join(mappe, 'synk'), LAGERLAAS_ALDER)
+    ferdig = threading.Event()
+
+    def forny():
+        while not ferdig.wait(LAGERLAAS_ALDER.total_seconds() / 4):
+            try:
+                os.utime(laas)
+            except FileNotFoundError:
+                pass
+
+    threading.Thread(target=forny, daemon=True).start()
+    try:
+        yield
+    finally:
+        ferdig.set()
+        try:
+            os.remove(laas)
+        except FileNotFoundError:
+            pass
+
+
+@tidtatt('synkroniser')
+def synkroniser(mappe=LAGERMAPPE, full=False, maks_alder=None):
+    # Med maks_alder blir det berre synkronisert om lageret framleis er utdatert når låsen
+    # er teken, sidan ein annan prosess kan ha gjort det medan denne venta
+    with _lagerlaas(mappe):
+        if maks_alder is not None and not full and not lager_utdatert(mappe, maks_alder):
+            return _les_meta(mappe)
+        return _synkroniser(mappe, full)
+
+
+def _synkroniser(mappe, full):
+    meta = _les_meta(mappe)
+    start = datetime.now()
+
+    if meta and not full:
+        sist_full = datetime.fromisoformat(meta['sist_full_synk'])
+        full = start - sist_full > FULL_SYNK
+    else:
+        full = True
+
+    if full:
+        df = klargjer(hent_parallelt({}))
+        shutil.rmtree(_skredmappe(mappe), ignore_errors=True)
+        _skriv_partisjonar(mappe, df, _partisjonar(df))
+        meta = {'sist_full_synk': start.isoformat(timespec='seconds'), 'delt': (meta or {}).get('delt')}
+    else:
+        endret_etter = datetime.fromisoformat(meta['sist_synkronisert']) - SYNK_MARGIN
+        endra = klargjer(hent_objekt({'endret_etter': endret_etter.isoformat(timespec='seconds')}))
+        if not endra.empty:
+            # Partisjonane, ikkje den delte fila, som har vref-kolonnene frå klargjer_vref i tillegg
+            gammal = _les_partisjonar(mappe=mappe)
+            if gammal is None:
+                gammal = endra.iloc[0:0]
+            erstatta = gammal['nvdbId'].isin(endra['nvdbId'])
+            partisjonar = _partisjonar(gammal[erstatta]) | _partisjonar(endra)
+            ny = pd.concat([gammal[~erstatta], endra], ignore_index=True)
+            _skriv_partisjonar(mappe, ny, partisjonar)
+
+    meta['sist_synkronisert'] = start.isoformat(timespec='seconds')
+    meta['antall_endra'] = None if full else len(endra)
+    os.makedirs(mappe, exist_ok=True)
+    if full or not endra.empty:
+        _publiser(mappe, meta)
+    _skriv_meta(mappe, meta)
+    _rydd_delt(mappe, meta)
+    return meta
+
+
+def lager_utdatert(mappe=LAGERMAPPE, maks_alder=timedelta(hours=1)):
+    meta = _les_meta(mappe)
+    if not meta or not os.path.isdir(_skredmappe(mappe)):
+        return True
+    return datetime.now() - datetime.fromisoformat(meta['sist_synkronisert']) > maks_alder
+
+
+def lagerversjon(mappe=LAGERMAPPE):
+    return (_les_meta(mappe) or {}).get('sist_synkronisert')
+
+
+_synk_laas = threading.Lock()
+
+
+def hent_fra_lager(filter, mappe=LAGERMAPPE, maks_alder=timedelta(hours=1)):
+    # Landsdekkande og fylkesvise uttak blir lest frå lokalt lager, som blir
+    # oppdatert med berre endra objekt når det er eldre enn maks_alder
+    with _synk_laas:
+        if lager_utdatert(mappe, maks_alder):
+            synkroniser(mappe, maks_alder=maks_alder)
+    return les_lager(filter, mappe)
+
+
+def kan_bruke_lager(filter):
+    return set(filter) <= {'fylke'}
+
+
+@tidtatt('last_skreddata')
+def last_skreddata(filter, losneomrade=None, fradato=None, tildato=None, buffer=None, fremdrift=None):
+    # Same veg for app og kommandolinje: buffer, så lokalt lager, så NVDB.
+    # Gir datasettet med geometri og vegposisjon, før dato- og løsneområdefilteret.
+    if buffer is not None:
+        # Bufra datasett frå lageret gjeld berre til lageret er utdatert eller synkronisert på nytt
+        buffer.gloym_lager(None if lager_utdatert() else lagerversjon())
+    df = buffer.hent(filter, losneomrade, fradato, tildato) if buffer is not None else None
+    if df is None and kan_bruke_lager(filter):
+        df = _versjon(klargjer_vref(klargjer_geometri(hent_fra_lager(filter))))
+        if buffer is not None:
+            buffer.legg_til(filter, df, lager=lagerversjon())
+    elif df is None:
+        df = _versjon(klargjer_vref(klargjer_geometri(klargjer(hent_skreddata(filter, losneomrade, fradato, tildato, fremdrift=fremdrift)))))
+        if buffer is not None:
+            buffer.legg_til(filter, df, losneomrade, fradato, tildato)
+    return df
+
+
+def _versjon(df, versjon=None):
+    # Ny versjon kvar gong eit datasett blir lasta. attrs følgjer med utval og kolonneuttak,
+    # så bufra resultat i appen kan nøklast på versjonen i staden for å hashe datasettet.
+    df.attrs['versjon'] = versjon or time.time_ns()
+    return df
+
+
+def _vegnokkel(vegfilter):
+    return (vegfilter['kategori'], vegfilter['fase'], vegfilter['nummer'])
+
+
+def _vegsporring(vegar):
+    # Éi spørring per veg: heile vegen om ein av linjene manglar strekning, elles frå
+    # første til siste strekning, så fleire strekningar på same veg deler nedlastinga
+    vegfilter = tolk_vegfilter(vegar[0]['vegsystemreferanse'])
+    veg = f"{vegfilter['kategori']}{(vegfilter['fase'] or 'v').lower()}{vegfilter['nummer']}"
+    if any(not v.get('strekning') for v in vegar):
+        return veg
+    return f"{veg}S{min(v['strekning'][0] for v in vegar)}-{max(v['strekning'][2] for v in vegar)}"
+
+
+@tidtatt('last_vegar')
+def last_vegar(filter, vegar, losneomrade=None, fradato=None, tildato=None, buffer=None, maks_vegar=MAKS_VEGAR,
+               fremdrift=None):
+    # vegar er ei liste med {'vegsystemreferanse': 'Rv5', 'strekning': (fra_strekning, fra_meter,
+    # til_strekning, til_meter) eller None}. Vegane blir henta samstundes med same buffer og lager
+    # som last_skreddata, og slått saman til eitt datasett utan dobbeltrader, sortert langs vegen.
+    # fremdrift(ferdige, totalt, vegfilter, antall) blir kalla frå kallande tråd.
+    gruppert = {}
+    for veg in vegar:
+        vegfilter = tolk_vegfilter(veg['vegsystemreferanse'])
+        if vegfilter is None or vegfilter['nummer'] is None:
+            raise ValueError(f"Ugyldig vegnummer: {veg['vegsystemreferanse']}")
+        gruppert.setdefault(_vegnokkel(vegfilter), []).append(veg)
+
+    def hent(vegliste):
+        sporring = _vegsporring(vegliste)
+        df = last_skreddata({**filter, 'vegsystemreferanse': sporring}, losneomrade, fradato, tildato, buffer=buffer)
+        if all(v.get('strekning') for v in vegliste):
+            df = pd.concat([vegstrekning(df, sporring, *v['strekning']) for v in vegliste])
+        return df
+
+    resultat = []
+    with ThreadPoolExecutor(max_workers=maks_vegar) as pool:
+        jobbar = {pool.submit(contextvars.copy_context().run, hent, vegliste): vegliste for vegliste in gruppert.values()}
+        for ferdige, jobb in enumerate(as_completed(jobbar), start=1):
+            df = jobb.result()
+            resultat.append(df)
+            if fremdrift:
+                fremdrift(ferdige, len(jobbar), _vegsporring(jobbar[jobb]), len(df))
+    df = slaa_saman(resultat)
+    if df.empty:
+        return df
+    # Versjonen til det samanslåtte datasettet endrar seg når ein av vegane blir lasta på nytt
+    versjon = hash(tuple(sorted(str(del_df.attrs.get('versjon')) for del_df in resultat)))
+    return _versjon(klargjer_vref(df.drop_duplicates(subset=NOKKEL, ignore_index=True)), versjon)
+
+
+@tidtatt('filter_df')
+def filtrer_utval(df, losneomrade=None, fradato=None, tildato=None):
+    # Dato- og løsneområdefilteret, None tek med alt
+    maske = pd.Series(True, index=df.index)
+    if fradato is not None:
+        maske &= df['Skred_dato'] >= fradato
+    if tildato is not None:
+        maske &= df['Skred_dato'] <= tildato
+    if losneomrade is not None:
+        maske &= df['Løsneområde'].isin(losneomrade)
+    if maske.all():
+        return df
+    return df[maske]
@@ -0,0 +1,233 @@
+import os
+import json
+import shutil
+import tempfile
+import io
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import ezdxf
+import ezdxf.colors
+import shapely
+import pyarrow as pa
+import pyarrow.parquet as pq
+import geopandas as gpd
+from pyproj import CRS
+from nvdbskred.geometri import GEOMETRIKOLONNER, KARTSYSTEM, klargjer_geometri
+from nvdbskred.vegreferanse import INDEKSKOLONNER
+from nvdbskred.tidtaking import tidtatt
+
+FORMAT = {'.csv': 'csv', '.parquet': 'parquet', '.gpkg': 'gpkg', '.xlsx': 'xlsx', '.geoparquet': 'geoparquet',
+          '.dxf': 'dxf'}
+
+FILENDING = {'csv': 'csv', 'parquet': 'parquet', 'gpkg': 'gpkg', 'xlsx': 'xlsx', 'geoparquet': 'parquet', 'dxf': 'dxf'}
+
+MIME = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'gpkg': 'application/geopackage+sqlite3',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'geoparquet': 'application/vnd.apache.parquet',
+    'dxf': 'image/vnd.dxf',
+}
+
+# Rader som blir gjort om og skrivne om gongen, minnebruken held seg på éi blokk
+BLOKK = 50_000
+
+# Namn på applikasjonen som eig XDATA-attributta i DXF-fila
+DXF_APP = 'NVDBSKRED'
+
+# Teikn som ikkje er lov i namn på lag i DXF
+_DXF_ULOVLEG = str.maketrans({teikn: '_' for teikn in '<>/\\":;?*|=`'})
+
+# Største tal på rader i eit Excel-ark, med overskrift
+EXCEL_RADER = 1_048_576
+
+
+def tabell(df):
+    # Kolonnene som blir med ut, utan hjelpekolonnene frå innlesinga
+    return df.drop(columns=[k for k in GEOMETRIKOLONNER + INDEKSKOLONNER if k in df])
+
+
+def filformat(sti, format=None):
+    format = format or FORMAT.get(os.path.splitext(sti)[1].lower())
+    if format not in FILENDING:
+        raise ValueError(f'Ukjent filformat for {sti}, bruk ein av {", ".join(FORMAT)}')
+    return format
+
+
+def _blokker(df, storleik=BLOKK):
+    for start in range(0, max(len(df), 1), storleik):
+        yield df.iloc[start:start + storleik]
+
+
+def skriv_csv(df, sti):
+    with open(sti, 'w', encoding='utf-8', newline='') as fil:
+        for nummer, blokk in enumerate(_blokker(tabell(df))):
+            blokk.to_csv(fil, header=nummer == 0, index=False)
+
+
+def skriv_xlsx(df, sti):
+    # constant_memory skriv kvar rad rett til fila i staden for å halde arket i minnet
+    import xlsxwriter
+    df = tabell(df)
+    if len(df) >= EXCEL_RADER:
+        raise ValueError(f'{len(df)} rader er for mange for eit Excel-ark, bruk CSV eller Parquet')
+    with xlsxwriter.Workbook(sti, {'constant_memory': True}) as bok:
+        ark = bok.add_worksheet('Skred')
+        dato = bok.add_format({'num_format': 'yyyy-mm-dd'})
+        for kolonne in df.select_dtypes(include='datetime').columns:
+            nummer = df.columns.get_loc(kolonne)
+            ark.set_column(nummer, nummer, 12, dato)
+        ark.write_row(0, 0, list(df.columns))
+        rad = 1
+        for blokk in _blokker(df):
+            blokk = blokk.astype(object).where(blokk.notna(), None)
+            for verdiar in blokk.itertuples(index=False):
+                ark.write_row(rad, 0, verdiar)
+                rad += 1
+
+
+def _geoblokk(blokk):
+    return gpd.GeoDataFrame(tabell(blokk).drop(columns=['geometri']), geometry=blokk['geometry'], crs=KARTSYSTEM)
+
+
+def skriv_gpkg(df, sti):
+    df = klargjer_geometri(df)
+    if os.path.exists(sti):
+        os.remove(sti)
+    for nummer, blokk in enumerate(_blokker(df)):
+        _geoblokk(blokk).to_file(sti, layer='skred', driver='GPKG', mode='w' if nummer == 0 else 'a')
+
+
+def _geometadata(geometri):
+    # GeoParquet 1.0-metadata for heile datasettet, så ho kan skrivast før første blokk
+    return {
+        'version': '1.0.0',
+        'primary_column': 'geometry',
+        'columns': {'geometry': {
+            'encoding': 'WKB',
+            'geometry_types': sorted(set(geometri.geom_type.dropna())),
+            'crs': CRS(KARTSYSTEM).to_json_dict(),
+            'bbox': [float(v) for v in geometri.total_bounds],
+        }},
+    }
+
+
+def skriv_parquet(df, sti):
+    skrivar = None
+    for blokk in _blokker(tabell(df)):
+        del_tabell = pa.Table.from_pandas(blokk, preserve_index=False)
+        if skrivar is None:
+            skrivar = pq.ParquetWriter(sti, del_tabell.schema)
+        skrivar.write_table(del_tabell)
+    skrivar.close()
+
+
+def skriv_geoparquet(df, sti):
+    df = klargjer_geometri(df)
+    skrivar = None
+    for blokk in _blokker(df):
+        del_tabell = pa.Table.from_pandas(tabell(blokk).drop(columns=['geometri']), preserve_index=False)
+        del_tabell = del_tabell.append_column('geometry', pa.array(shapely.to_wkb(blokk['geometry'].values), pa.binary()))
+        if skrivar is None:
+            metadata = {**(del_tabell.schema.metadata or {}), b'geo': json.dumps(_geometadata(df['geometry'])).encode()}
+            skjema = del_tabell.schema.with_metadata(metadata)
+            skrivar = pq.ParquetWriter(sti, skjema)
+        skrivar.write_table(del_tabell.cast(skjema))
+    skrivar.close()
+
+
+def _dxf_xdata(df):
+    # XDATA-blokka for kvar rad som ferdig DXF-tekst, bygd kolonnevis
+    df = tabell(df).drop(columns=['geometri'])
+    xdata = pd.Series(f'1001\n{DXF_APP}\n', index=df.index)
+    for kolonne in df.columns:
+        verdi = df[kolonne]
+        if pd.api.types.is_datetime64_any_dtype(verdi):
+            verdi = verdi.dt.strftime('%Y-%m-%d')
+        verdi = verdi.astype(object).where(verdi.notna(), '').astype(str).str.replace('\n', ' ')
+        xdata += (f'1000\n{kolonne}=' + verdi).str[:260] + '\n'
+    return xdata.to_numpy()
+
+
+def _dxf_mal(lag):
+    dok = ezdxf.new('R2010', units=ezdxf.units.M)
+    dok.appids.add(DXF_APP)
+    for namn, farge in lag.items():
+        dok.layers.add(namn, true_color=ezdxf.colors.rgb2int(ezdxf.colors.RGB.from_hex(farge)))
+    return dok
+
+
+def skriv_dxf(df, sti):
+    # Linjene blir skrivne i koordinatane frå NVDB (UTM sone 33), eitt lag per skredtype
+    # i fargane frå kartet, og attributta som XDATA. ezdxf lagar dokumentet med lag og
+    # tabellar, medan entitetane blir skrivne som tekst rett frå koordinatarraya, utan
+    # Python-objekt per punkt. Handles blir reserverte i dokumentet før det blir skrive.
+    from nvdbskred.kartfunksjoner import fargekart
+    df = klargjer_geometri(df)
+    typar = df['Type_skred'].astype(object).where(df['Type_skred'].notna(), 'Ukjent').to_numpy()
+    lagnamn = {skredtype: str(skredtype).translate(_DXF_ULOVLEG) for skredtype in dict.fromkeys(typar)}
+    dok = _dxf_mal({namn: fargekart.get(skredtype, '#000000') for skredtype, namn in lagnamn.items()})
+    eigar = dok.modelspace().layout_key
+
+    # Multigeometri blir delt opp, kvar del får attributta til raden sin
+    deler, rad = shapely.get_parts(df['geometry'].values, return_index=True)
+    deler, rad = deler[~shapely.is_empty(deler)], rad[~shapely.is_empty(deler)]
+    koordinatar, del_nummer = shapely.get_coordinates(deler, return_index=True)
+    start = np.r_[0, np.flatnonzero(np.diff(del_nummer)) + 1, len(del_nummer)]
+    punkt = shapely.get_type_id(deler) == 0
+    xdata = _dxf_xdata(df)
+    lag = [lagnamn[skredtype] for skredtype in typar]
+    punktliste = [f' 10\n{x:.3f}\n 20\n{y:.3f}\n' for x, y in koordinatar.tolist()]
+
+    handle = int(dok.entitydb.handles.next(), 16)
+    dok.entitydb.handles.reset(f'{handle + len(deler) + 1:X}')
+    mal = io.StringIO()
+    dok.write(mal)
+    mal = mal.getvalue()
+    innsett = mal.index('  2\nENTITIES\n') + len('  2\nENTITIES\n')
+
+    with open(sti, 'w', encoding='utf-8', newline='\n') as fil:
+        fil.write(mal[:innsett])
+        for nummer in range(len(deler)):
+            i = rad[nummer]
+            fra, til = start[nummer], start[nummer + 1]
+            if punkt[nummer]:
+                fil.write(f'  0\nPOINT\n  5\n{handle + nummer:X}\n330\n{eigar}\n100\nAcDbEntity\n  8\n{lag[i]}\n'
+                          f'100\nAcDbPoint\n{punktliste[fra]} 30\n0.0\n{xdata[i]}')
+            else:
+                fil.write(f'  0\nLWPOLYLINE\n  5\n{handle + nummer:X}\n330\n{eigar}\n100\nAcDbEntity\n  8\n{lag[i]}\n'
+                          f'100\nAcDbPolyline\n 90\n{til - fra}\n 70\n0\n{"".join(punktliste[fra:til])}{xdata[i]}')
+        fil.write(mal[innsett:])
+
+
+SKRIVARAR = {
+    'csv': skriv_csv,
+    'parquet': skriv_parquet,
+    'gpkg': skriv_gpkg,
+    'xlsx': skriv_xlsx,
+    'geoparquet': skriv_geoparquet,
+    'dxf': skriv_dxf,
+}
+
+
+@tidtatt('eksport')
+def skriv(df, sti, format=None):
+    # Skriv blokk for blokk rett til fila, så minnebruken ikkje veks med talet på rader
+    format = filformat(sti, format)
+    mappe = os.path.dirname(sti)
+    if mappe:
+        os.makedirs(mappe, exist_ok=True)
+    SKRIVARAR[format](df, sti)
+    return sti
+
+
+@contextmanager
+def eksportfil(df, format):
+    # Skriv til ei mellombels fil som blir sletta når blokka er ferdig
+    mappe = tempfile.mkdtemp(prefix='nvdbskred-')
+    try:
+        yield skriv(df, os.path.join(mappe, f'skredpunkt.{FILENDING[format]}'), format)
+    finally:
+        shutil.rmtree(mappe, ignore_errors=True)
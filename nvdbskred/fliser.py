@@ -0,0 +1,214 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import shapely
+from branca.element import MacroElement, JavascriptLink
+from jinja2 import Template
+from pyproj import Transformer
+import mapbox_vector_tile
+from nvdbskred.tidtaking import tidtatt
+
+# Storleiken på ei flis i koordinatane inne i fila (MVT extent)
+UTSTREKNING = 4096
+
+# Kant rundt kvar flis (i flisekoordinatar) så linjer ikkje blir kutta synleg i flisekanten
+KANT = 64
+
+# Forenkling i flisekoordinatar. 16 einingar er eitt skjermpunkt på ei 256-flis, så dette er under det som synest
+FORENKLING = 8
+
+# Under MIN_ZOOM viser kartet rutenettet i staden, sjå rutenett.legg_til_rutenett
+MIN_ZOOM, MAKS_ZOOM = 8, 16
+
+# Fliser som blir haldne i minnet per datasett, og datasett som blir haldne samstundes
+FLISEBUFFER = int(os.environ.get('NVDBSKRED_FLISEBUFFER', 4096))
+MAKS_DATASETT = 8
+
+# Port for flisetenesta, 0 gir ledig port. Adressa nettlesaren bruker kan overstyrast
+# når appen ligg bak ein proxy, f.eks https://skred.example.no/fliser
+FLISEPORT = int(os.environ.get('NVDBSKRED_FLISEPORT', 0))
+FLISEURL = os.environ.get('NVDBSKRED_FLISEURL')
+
+# Tenesta lyttar berre på 127.0.0.1, så nettlesarar på andre maskiner når henne berre
+# gjennom ein proxy med fast adresse. Utan det viser appen rutenett og linjer i sida.
+FLISER_PAA = bool(FLISEURL) and FLISEPORT != 0
+
+LAG = 'skred'
+
+# Halve omkrinsen i Web Mercator (EPSG:3857)
+_MERCATOR = 20037508.342789244
+
+_STI = re.compile(r'^/(?P<nokkel>[0-9a-zA-Z_-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$')
+
+
+def flisegrenser(z, x, y):
+    # Flisa i Web Mercator-meter (minx, miny, maxx, maxy), y=0 er nord som i XYZ-fliser
+    storleik = 2 * _MERCATOR / 2 ** z
+    return (-_MERCATOR + x * storleik, _MERCATOR - (y + 1) * storleik,
+            -_MERCATOR + (x + 1) * storleik, _MERCATOR - y * storleik)
+
+
+class Flisepyramide:
+    # Vektorfliser for eitt datasett. Geometrien blir transformert til Web Mercator og lagt
+    # i eit STRtree éin gong, og kvar flis blir klipt, forenkla og koda når ho blir spurt om.
+    def __init__(self, df):
+        transformer = Transformer.from_crs('EPSG:4326', 'EPSG:3857', always_xy=True)
+        geometri = np.asarray(df['geometri_wgs84'].values)
+        gyldig = ~(shapely.is_missing(geometri) | shapely.is_empty(geometri))
+        self.geometri = shapely.transform(geometri[gyldig],
+                                          lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+        self.tre = shapely.STRtree(self.geometri)
+        self.egenskapar = {
+            'Type_skred': df['Type_skred'].astype(object).where(df['Type_skred'].notna(), 'Ukjent').to_numpy()[gyldig],
+            'Skred_dato': df['Skred_dato'].dt.strftime('%Y-%m-%d').fillna('').to_numpy()[gyldig],
+            'vref': df['vref'].astype(object).where(df['vref'].notna(), '').to_numpy()[gyldig],
+        }
+        self.flis = lru_cache(maxsize=FLISEBUFFER)(self._flis)
+
+    @tidtatt('vektorflis')
+    def _flis(self, z, x, y):
+        minx, miny, maxx, maxy = flisegrenser(z, x, y)
+        skala = UTSTREKNING / (maxx - minx)
+        kant = KANT / skala
+        treff = self.tre.query(shapely.box(minx - kant, miny - kant, maxx + kant, maxy + kant))
+        if not len(treff):
+            return b''
+        # Til flisekoordinatar (0-4096, y opp), så klipping og forenkling skjer i skjermpunkt
+        geometri = shapely.transform(self.geometri[treff], lambda xy: (xy - [minx, miny]) * skala)
+        geometri = shapely.clip_by_rect(geometri, -KANT, -KANT, UTSTREKNING + KANT, UTSTREKNING + KANT)
+        geometri = shapely.simplify(geometri, FORENKLING, preserve_topology=False)
+        med = ~shapely.is_empty(geometri)
+        egenskapar = {namn: verdi[treff][med] for namn, verdi in self.egenskapar.items()}
+        objekt = [{'geometry': g, 'properties': {namn: str(verdi[i]) for namn, verdi in egenskapar.items()}}
+                  for i, g in enumerate(geometri[med])]
+        return mapbox_vector_tile.encode({'name': LAG, 'features': objekt},
+                                         default_options={'extents': UTSTREKNING})
+
+
+    def fliser(self, z):
+        # (x, y) for flisene på zoom z som har geometri, frå boksen rundt kvar geometri
+        minx, miny, maxx, maxy = shapely.bounds(self.geometri).T
+        storleik = 2 * _MERCATOR / 2 ** z
+        x0, x1 = ((np.stack([minx, maxx]) + _MERCATOR) // storleik).astype(np.int64).clip(0, 2 ** z - 1)
+        y0, y1 = ((_MERCATOR - np.stack([maxy, miny])) // storleik).astype(np.int64).clip(0, 2 ** z - 1)
+        breidd, hogd = x1 - x0 + 1, y1 - y0 + 1
+        # Kvar geometri gir breidd * hogd fliser, dei fleste berre éi
+        antall = breidd * hogd
+        nummer = np.repeat(np.arange(len(antall)), antall)
+        steg = np.arange(antall.sum()) - np.repeat(np.cumsum(antall) - antall, antall)
+        x = x0[nummer] + steg % breidd[nummer]
+        y = y0[nummer] + steg // breidd[nummer]
+        return np.unique(np.stack([x, y], axis=1), axis=0)
+
+    @tidtatt('flisepyramide')
+    def skriv(self, mappe, min_zoom=MIN_ZOOM, maks_zoom=12):
+        # Heile pyramiden som z/x/y.pbf under mappe, for statisk publisering
+        antall = 0
+        for z in range(min_zoom, maks_zoom + 1):
+            for x, y in self.fliser(z).tolist():
+                innhald = self._flis(z, x, y)
+                if not innhald:
+                    continue
+                os.makedirs(os.path.join(mappe, str(z), str(x)), exist_ok=True)
+                with open(os.path.join(mappe, str(z), str(x), f'{y}.pbf'), 'wb') as f:
+                    f.write(innhald)
+                antall += 1
+        return antall
+
+
+class Flisehandsamar(BaseHTTPRequestHandler):
+    teneste = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        treff = _STI.match(self.path.split('?')[0])
+        pyramide = self.teneste.pyramide(treff['nokkel']) if treff else None
+        z = int(treff['z']) if treff else -1
+        if pyramide is None or not MIN_ZOOM <= z <= MAKS_ZOOM:
+            self.send_response(404)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            return
+        innhald = pyramide.flis(z, int(treff['x']), int(treff['y']))
+        self.send_response(200 if innhald else 204)
+        self.send_header('Content-Type', 'application/vnd.mapbox-vector-tile')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'max-age=3600')
+        self.send_header('Content-Length', str(len(innhald)))
+        self.end_headers()
+        self.wfile.write(innhald)
+
+
+class Fliseteneste:
+    # Liten HTTP-teneste i ein bakgrunnstråd som gir ut fliser for registrerte datasett
+    def __init__(self, port=FLISEPORT, url=FLISEURL):
+        handsamar = type('Flisehandsamar', (Flisehandsamar,), {'teneste': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handsamar)
+        self.server.daemon_threads = True
+        self.url = (url or f'http://127.0.0.1:{self.server.server_address[1]}').rstrip('/')
+        self.datasett = OrderedDict()
+        self.laas = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def registrer(self, nokkel, df):
+        # Gir URL-malen for flisene til datasettet, pyramiden blir bygd første gong
+        with self.laas:
+            if nokkel not in self.datasett:
+                self.datasett[nokkel] = Flisepyramide(df)
+                while len(self.datasett) > MAKS_DATASETT:
+                    self.datasett.popitem(last=False)
+            self.datasett.move_to_end(nokkel)
+        return f'{self.url}/{nokkel}/{{z}}/{{x}}/{{y}}.pbf'
+
+    def pyramide(self, nokkel):
+        with self.laas:
+            return self.datasett.get(nokkel)
+
+    def stopp(self):
+        self.server.shutdown()
+
+
+class Vektorfliser(MacroElement):
+    # Lag i Leaflet som hentar MVT-flisene med Leaflet.VectorGrid, berre for utsnittet som blir vist
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+            rendererFactory: L.canvas.tile,
+            interactive: true,
+            minZoom: {{ this.min_zoom }},
+            maxNativeZoom: {{ this.maks_zoom }},
+            vectorTileLayerStyles: {
+                {{ this.lag|tojson }}: function (egenskapar) {
+                    var fargar = {{ this.fargar|tojson }};
+                    return {color: fargar[egenskapar.Type_skred] || '#000000', weight: 6, opacity: 0.9};
+                }
+            }
+        }).on('click', function (e) {
+            var p = e.layer.properties;
+            L.popup().setLatLng(e.latlng)
+                .setContent(p.Type_skred + '<br>' + p.Skred_dato + '<br>' + p.vref)
+                .openOn({{ this._parent.get_name() }});
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, url, fargar, min_zoom=MIN_ZOOM, maks_zoom=MAKS_ZOOM):
+        super().__init__()
+        self._name = 'Vektorfliser'
+        self.url = url
+        self.fargar = fargar
+        self.lag = LAG
+        self.min_zoom = min_zoom
+        self.maks_zoom = maks_zoom
+
+    def render(self, **kwargs):
+        figure = self.get_root()
+        figure.header.add_child(JavascriptLink(
+            'https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.min.js'), name='vectorgrid')
+        super().render(**kwargs)
@@ -0,0 +1,45 @@
+import numpy as np
+import shapely
+import geopandas as gpd
+from pyproj import Transformer
+from nvdbskred.tidtaking import tidtatt
+
+# Koordinatsystemet geometrien kjem i frå NVDB
+KARTSYSTEM = 'EPSG:32633'
+
+# Kolonner som blir lagt til ved innlesing, og som ikkje skal med i nedlasting
+GEOMETRIKOLONNER = ['geometry', 'geometri_wgs84', 'midt_lon', 'midt_lat']
+
+
+def til_wgs84(geometriar):
+    transformer = Transformer.from_crs(KARTSYSTEM, 'EPSG:4326', always_xy=True)
+    return shapely.transform(geometriar, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
+def til_kartsystem(geometriar):
+    transformer = Transformer.from_crs('EPSG:4326', KARTSYSTEM, always_xy=True)
+    return shapely.transform(geometriar, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
+def midtpunkt(geometriar):
+    # Midtpunkt langs linja, punktgeometri blir brukt som den er
+    linje = np.isin(shapely.get_type_id(geometriar), [1, 5])
+    punkt = geometriar.copy()
+    punkt[linje] = shapely.line_interpolate_point(geometriar[linje], 0.5, normalized=True)
+    return punkt
+
+
+@tidtatt('geometri')
+def klargjer_geometri(df):
+    # Tolkar WKT éin gong ved innlesing, og reknar ut WGS84-geometri og midtpunkt
+    # for karta, slik at kartfunksjonane aldri treng tolke eller endre datasettet
+    if 'geometry' in df:
+        return df
+    linjer = shapely.from_wkt(df['geometri'].to_numpy(dtype=object), on_invalid='ignore')
+    midt = til_wgs84(midtpunkt(linjer))
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.GeoSeries(linjer, index=df.index, crs=KARTSYSTEM))
+    # Seks desimalar i grader er om lag 0,1 m, og held kartdata til nettlesaren små
+    gdf['geometri_wgs84'] = shapely.set_precision(til_wgs84(linjer), 1e-6)
+    gdf['midt_lon'] = shapely.get_x(midt)
+    gdf['midt_lat'] = shapely.get_y(midt)
+    return gdf
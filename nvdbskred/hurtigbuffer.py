@@ -0,0 +1,178 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from nvdbskred.vegreferanse import tolk_vegfilter, vegfilter_dekker, vegfilter_maske
+from nvdbskred.skjema import minnebruk
+from nvdbskred.romindeks import Romindeks
+from nvdbskred.statistikk import frekvens
+
+# Minnebudsjett for bufra datasett, kan overstyrast med miljøvariabel
+MAKS_MINNE = int(os.environ.get('NVDBSKRED_BUFFER_MB', 1024)) * 1024 ** 2
+
+
+def _nokkel(filter, losneomrade, fradato, tildato):
+    return (tuple(sorted((k, str(v)) for k, v in filter.items())),
+            None if losneomrade is None else tuple(sorted(losneomrade)),
+            fradato, tildato)
+
+
+def _utval_dekker(vid, smal):
+    # Dato og løsneområde som eventuelt er sendt til NVDB må vere minst like vide
+    vid_losne, vid_fra, vid_til = vid
+    smal_losne, smal_fra, smal_til = smal
+    if vid_losne is not None and (smal_losne is None or not set(smal_losne) <= set(vid_losne)):
+        return False
+    if vid_fra is not None and (smal_fra is None or str(smal_fra) < str(vid_fra)):
+        return False
+    if vid_til is not None and (smal_til is None or str(smal_til) > str(vid_til)):
+        return False
+    return True
+
+
+def _lokal_maske(df, nokkel, verdi):
+    # Maske for filterledd som kan evaluerast lokalt, None om det ikkje går
+    if nokkel == 'fylke' and 'fylke' in df:
+        return df['fylke'].astype(int) == int(verdi)
+    if nokkel == 'vegsystemreferanse':
+        vegfilter = tolk_vegfilter(verdi)
+        if vegfilter is not None:
+            return vegfilter_maske(df, vegfilter)
+    if nokkel == 'kontraktsomrade' and 'kontraktsomrader' in df:
+        # Kontraktsområda er lagra som kategori, så vi sjekkar kvar ulike kombinasjon éin gong
+        kontrakter = df['kontraktsomrader'].astype('category')
+        treff = [verdi in str(navn).split(';') for navn in kontrakter.cat.categories]
+        return pd.Series(np.isin(kontrakter.cat.codes, np.flatnonzero(treff)), index=df.index)
+    return None
+
+
+def filter_dekker(vid, smal, df):
+    # True om datasettet df for filteret vid kan gi svaret for filteret smal
+    for nokkel, verdi in vid.items():
+        if nokkel not in smal:
+            return False
+        if nokkel == 'vegsystemreferanse':
+            if not vegfilter_dekker(tolk_vegfilter(verdi), tolk_vegfilter(smal[nokkel])):
+                return False
+        elif str(verdi) != str(smal[nokkel]):
+            return False
+    for nokkel in smal:
+        if nokkel not in vid and nokkel not in ('fylke', 'vegsystemreferanse', 'kontraktsomrade'):
+            return False
+        if nokkel == 'fylke' and 'fylke' not in df:
+            return False
+        if nokkel == 'kontraktsomrade' and 'kontraktsomrader' not in df:
+            return False
+    return True
+
+
+def filtrer_lokalt(df, vid, smal):
+    # Som i NVDB tek vi med alle vegsegment for objekt der eitt segment treff filteret
+    maske = None
+    for nokkel, verdi in smal.items():
+        if nokkel in vid and nokkel != 'vegsystemreferanse':
+            continue
+        ledd = _lokal_maske(df, nokkel, verdi)
+        maske = ledd if maske is None else maske & ledd
+    if maske is None:
+        return df
+    return df[df['nvdbId'].isin(df.loc[maske, 'nvdbId'])]
+
+
+class Filterbuffer:
+    # LRU-buffer for skreddatasett som svarar smalare filter (land ⊇ fylke ⊇ veg ⊇ delstrekning)
+    # ved å filtrere eit bufra vidare datasett lokalt
+    def __init__(self, maks_minne=MAKS_MINNE):
+        self.maks_minne = maks_minne
+        self.datasett = OrderedDict()
+        self.indeksar = {}
+        self.statistikkar = {}
+        # sist_synkronisert for datasett som kjem frå det lokale lageret
+        self.lager = {}
+        self.laas = threading.Lock()
+
+    def minnebruk(self):
+        return sum(storleik for _, _, storleik in self.datasett.values())
+
+    def oversikt(self):
+        # Minnebruk per bufra datasett, sist brukt først
+        with self.laas:
+            rader = [{'filter': ', '.join(f'{k}={v}' for k, v in vid.items()) or 'Landsdekkende',
+                      'rader': len(df), 'MB': round(storleik / 1024 ** 2, 1)}
+                     for vid, df, storleik in reversed(self.datasett.values())]
+        return pd.DataFrame(rader, columns=['filter', 'rader', 'MB'])
+
+    def legg_til(self, filter, df, losneomrade=None, fradato=None, tildato=None, lager=None):
+        nokkel = _nokkel(filter, losneomrade, fradato, tildato)
+        storleik = minnebruk(df)
+        with self.laas:
+            self.datasett[nokkel] = (dict(filter), df, storleik)
+            self.datasett.move_to_end(nokkel)
+            self._gloym(nokkel)
+            if lager is not None:
+                self.lager[nokkel] = lager
+            while self.minnebruk() > self.maks_minne and len(self.datasett) > 1:
+                gammal, _ = self.datasett.popitem(last=False)
+                self._gloym(gammal)
+
+    def _gloym(self, nokkel):
+        # Indeks og statistikk høyrer til eitt datasett og blir fjerna saman med det
+        self.indeksar.pop(nokkel, None)
+        self.lager.pop(nokkel, None)
+        for statistikk in [k for k in self.statistikkar if k[0] == nokkel]:
+            del self.statistikkar[statistikk]
+
+    def gloym_lager(self, lager):
+        # Fjernar datasett frå lageret som ikkje er frå synken lager (sist_synkronisert),
+        # alle når lager er None, så neste spørring les det oppdaterte lageret
+        with self.laas:
+            for nokkel in [k for k, synk in self.lager.items() if synk != lager]:
+                del self.datasett[nokkel]
+                self._gloym(nokkel)
+
+    def _dekkande(self, filter, losneomrade, fradato, tildato):
+        # Nøkkelen til same filter, eller til minste bufra datasett som dekker spørringa
+        nokkel = _nokkel(filter, losneomrade, fradato, tildato)
+        if nokkel in self.datasett:
+            return nokkel
+        utval = nokkel[1:]
+        kandidatar = [(storleik, k) for k, (vid, df, storleik) in self.datasett.items()
+                      if _utval_dekker(k[1:], utval) and filter_dekker(vid, filter, df)]
+        if not kandidatar:
+            return None
+        return min(kandidatar, key=lambda kandidat: kandidat[0])[1]
+
+    def hent(self, filter, losneomrade=None, fradato=None, tildato=None):
+        with self.laas:
+            nokkel = self._dekkande(filter, losneomrade, fradato, tildato)
+            if nokkel is None:
+                return None
+            self.datasett.move_to_end(nokkel)
+            vid, df, _ = self.datasett[nokkel]
+        if nokkel == _nokkel(filter, losneomrade, fradato, tildato):
+            return df
+        return filtrer_lokalt(df, vid, filter)
+
+    def romindeks(self, filter, losneomrade=None, fradato=None, tildato=None):
+        # Romleg indeks over det bufra datasettet som svarar filteret, bygd éin gong per datasett
+        with self.laas:
+            nokkel = self._dekkande(filter, losneomrade, fradato, tildato)
+            if nokkel is None:
+                return None
+            if nokkel not in self.indeksar:
+                self.indeksar[nokkel] = Romindeks(self.datasett[nokkel][1])
+            return self.indeksar[nokkel]
+
+    def statistikk(self, filter, losneomrade=None, fradato=None, tildato=None, bitlengd=None):
+        # Frekvensstatistikk for det bufra datasettet som svarar filteret, rekna éin gong
+        # per datasett, segmentlengd og datoar. Sjå statistikk.utval for radene i eit utval.
+        with self.laas:
+            nokkel = self._dekkande(filter, losneomrade, fradato, tildato)
+            if nokkel is None:
+                return None
+            # Datoane avgrensar både skreda og åra raten blir rekna over
+            statistikk = (nokkel, bitlengd, fradato, tildato)
+            if statistikk not in self.statistikkar:
+                self.statistikkar[statistikk] = frekvens(self.datasett[nokkel][1], bitlengd, fradato, tildato)
+            return self.statistikkar[statistikk]
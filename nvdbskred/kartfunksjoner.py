@@ -1,73 +1,92 @@
+import json
 import folium
+from folium.plugins import FastMarkerCluster
 import streamlit_folium
 import geopandas as gpd
 from nvdbskred.plotfunksjoner import style_function
-from shapely import wkt
+from nvdbskred.geometri import GEOMETRIKOLONNER
 import pandas as pd
+from nvdbskred.tidtaking import tidtatt
+from nvdbskred.rutenett import legg_til_rutenett, RUTENETTGRENSE, RAADATAGRENSE
+from nvdbskred.fliser import Vektorfliser
 
-def kart(df):
-    df['geometry'] = df.loc[:,'geometri'].apply(wkt.loads)
-    gdf = gpd.GeoDataFrame(df, geometry='geometry')
-    gdf.crs = "EPSG:32633"
-    gdf_wgs84 = gdf.to_crs("EPSG:4326")
-    for column in gdf_wgs84.columns:
-        gdf_wgs84[column] = gdf_wgs84[column].apply(lambda x: x.strftime('%Y-%m-%d') if isinstance(x, pd.Timestamp) else x)
+@tidtatt('kart')
+def kart(df, fliser=None):
+    # Geometrien er tolka og transformert ved innlesing, sjå geometri.klargjer_geometri
+    if fliser is not None:
+        # Linjene kjem som vektorfliser frå flisetenesta (URL-mal), berre for utsnittet som blir vist
+        m = folium.Map(location=[df['midt_lat'].mean(), df['midt_lon'].mean()], zoom_start=10)
+        linjer = Vektorfliser(fliser, fargekart)
+        if len(df) > RUTENETTGRENSE:
+            legg_til_rutenett(m, df, linjer)
+        else:
+            linjer.add_to(m)
+        return streamlit_folium.folium_static(m)
+    if len(df) > RAADATAGRENSE:
+        # Store utval blir berre sende som rutenett, sjå rutenett.legg_til_rutenett
+        m = folium.Map(location=[df['midt_lat'].mean(), df['midt_lon'].mean()], zoom_start=5)
+        return streamlit_folium.folium_static(legg_til_rutenett(m, df))
+    egenskapar = df.drop(columns=GEOMETRIKOLONNER + ['geometri'])
+    for column in egenskapar.select_dtypes(include='datetime').columns:
+        egenskapar[column] = egenskapar[column].dt.strftime('%Y-%m-%d')
+    gdf_wgs84 = gpd.GeoDataFrame(egenskapar, geometry=gpd.GeoSeries(df['geometri_wgs84'], index=df.index), crs='EPSG:4326')
 
 
-    middle_idx = len(gdf_wgs84) // 2
-    linestring = gdf_wgs84.iloc[middle_idx]['geometry']
-
-    midpoint = linestring.interpolate(0.5, normalized=True)
+    middle_idx = len(df) // 2
+    midpoint_lat, midpoint_lon = df['midt_lat'].iloc[middle_idx], df['midt_lon'].iloc[middle_idx]
     #st.write(gdf)
 
-    m = folium.Map(location=[midpoint.y, midpoint.x], zoom_start=10)  # Adjust latitude and longitude to center your map
+    m = folium.Map(location=[midpoint_lat, midpoint_lon], zoom_start=10)  # Adjust latitude and longitude to center your map
     #folium.TileLayer('https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png', 
     #             name="CartoDB Dark Matter", 
     #             attr="© OpenStreetMap contributors, © CartoDB").add_to(m)
-    for _, row in gdf_wgs84.iterrows():
-        geojson_row = gpd.GeoDataFrame([row]).to_json()
-        folium.GeoJson(
-            geojson_row,
-            style_function=style_function
-        ).add_to(m)
+    # Eitt lag med alle linjene, fargen blir sett per objekt av style_function
+    linjer = folium.FeatureGroup(name='Skred')
+    folium.GeoJson(
+        gdf_wgs84,
+        style_function=style_function
+    ).add_to(linjer)
+    if len(df) > RUTENETTGRENSE:
+        # Rutenett på låg zoom, linjene først når ein zoomar inn
+        legg_til_rutenett(m, df, linjer)
+    else:
+        linjer.add_to(m)
     return streamlit_folium.folium_static(m)
 
-def create_point_map(df):
-    # Convert 'geometri' column to GeoSeries
-    df['geometry'] = df.loc[:,'geometri'].apply(wkt.loads)
-    gdf = gpd.GeoDataFrame(df, geometry='geometry')
+# Over så mange punkt blir punkta klynga og teikna i nettlesaren
+KLYNGEGRENSE = 1000
 
-    # Set the coordinate system for the GeoDataFrame to UTM 33N
-    gdf.crs = "EPSG:32633"
+fargekart = {
+    'Stein': '#b2b2b2',
+    'Is/stein': '#73ffdf',
+    'Jord/løsmasse': '#a87000',
+    'Flomskred (vann+stein+jord)': '#0070FF',
+    'Is': '#73ffdf',
+    'Snø': '#ffffff',
+    'Sørpeskred (vann+snø+stein)': '#c9a575',
+}
 
-    # Compute midpoints
-    
- 
-    # Transform to WGS 84
-    gdf = gdf.to_crs("EPSG:4326")
-
-    gdf['midtpunkt'] = gdf['geometry'].interpolate(0.5, normalized=True)
+@tidtatt('punktkart')
+def create_point_map(df, klynge=None):
+    # Midtpunkta i WGS 84 er rekna ut ved innlesing, sjå geometri.klargjer_geometri
 
     # Determine center of the map
-    center = gdf['midtpunkt'].unary_union.centroid
-    m = folium.Map(location=[center.y, center.x], zoom_start=10)
+    m = folium.Map(location=[df['midt_lat'].mean(), df['midt_lon'].mean()], zoom_start=10, prefer_canvas=True)
 
-    # Define colormap
-    color_map = {
-        'Stein': '#b2b2b2',
-        'Is/stein': '#73ffdf',
-        'Jord/løsmasse': '#a87000',
-        'Flomskred (vann+stein+jord)': '#0070FF',
-        'Is': '#73ffdf',
-        'Snø': '#ffffff',
-        'Sørpeskred (vann+snø+stein)': '#c9a575',
-    }
+    if len(df) > RUTENETTGRENSE:
+        # Rutenett på låg zoom og klynga punkt frå DETALJZOOM, tabellen med punkt er kompakt nok for alle storleikar
+        return legg_til_rutenett(m, df, punktlag(df))
+    if klynge is None:
+        klynge = len(df) > KLYNGEGRENSE
+    if klynge:
+        punktlag(df).add_to(m)
+        return m
 
     # Add midpoints to the map
-    for _, row in gdf.iterrows():
-        point_color = color_map.get(row['Type_skred'], '#000000')  # Default to black if not found
+    for _, row in df.iterrows():
+        point_color = fargekart.get(row['Type_skred'], '#000000')  # Default to black if not found
         folium.CircleMarker(
-            location=[row['midtpunkt'].y, row['midtpunkt'].x],
+            location=[row['midt_lat'], row['midt_lon']],
             radius=5,
             color=point_color,
             fill=True,
@@ -75,4 +94,29 @@ def create_point_map(df):
             popup=row['Skred_dato']  # This will show the Type_skred value when clicking on a point
         ).add_to(m)
     
-    return m
\ No newline at end of file
+    return m
+
+def punktlag(df):
+    # Sender punkta som ein kompakt tabell [lat, lon, fargeindeks, dato] og lar
+    # nettlesaren lage markørane, klynga og teikna på canvas
+    df = df.dropna(subset=['midt_lat', 'midt_lon'])
+    typar = list(fargekart)
+    fargeindeks = pd.Categorical(df['Type_skred'].astype(object), categories=typar).codes
+    data = pd.DataFrame({
+        'lat': df['midt_lat'].round(6),
+        'lon': df['midt_lon'].round(6),
+        'farge': fargeindeks,
+        'dato': df['Skred_dato'].dt.strftime('%Y-%m-%d').fillna(''),
+    }).values.tolist()
+    fargar = [fargekart[t] for t in typar] + ['#000000']
+    callback = f"""
+        var fargar = {json.dumps(fargar)};
+        var callback = function (row) {{
+            var farge = fargar[row[2] < 0 ? fargar.length - 1 : row[2]];
+            var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+                {{radius: 5, color: farge, fill: true, fillOpacity: 0.6}});
+            marker.bindPopup(row[3]);
+            return marker;
+        }};
+    """
+    return FastMarkerCluster(data, callback=callback, disableClusteringAtZoom=12)
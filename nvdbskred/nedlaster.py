@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+
+# Kan peikast mot ein lokal stubbserver for testing
+NVDB_API = os.environ.get('NVDBSKRED_API', 'https://nvdbapiles-v3.atlas.vegvesen.no')
+
+TIDSAVBRUDD = 60
+SIDESTORLEIK = 1000
+
+# Forsøk og venting når NVDB strupar eller mistar sambandet
+MAKS_FORSOK = 8
+BACKOFF = 2
+MAKS_VENTETID = 120
+STRUPING = [429, 502, 503, 504]
+
+# Sjekkpunkt eldre enn dette blir forkasta i staden for å halde fram
+MAKS_SJEKKPUNKT_ALDER = timedelta(days=1)
+
+# Ein lås som ikkje er fornya på så lenge, høyrer til ei nedlasting som er stoppa
+MAKS_LAAS_ALDER = timedelta(seconds=MAKS_FORSOK * (TIDSAVBRUDD + MAKS_VENTETID))
+
+
+class NedlastingsFeil(Exception):
+    pass
+
+
+def lag_sesjon(pool=8):
+    sesjon = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool)
+    sesjon.mount('https://', adapter)
+    sesjon.mount('http://', adapter)
+    sesjon.headers.update({'accept': 'application/vnd.vegvesen.nvdb-v3-rev1+json',
+                           'X-Client': 'nvdbskred'})
+    return sesjon
+
+
+def _ventetid(forsok, respons=None):
+    if respons is not None and respons.headers.get('Retry-After', '').isdigit():
+        return min(int(respons.headers['Retry-After']), MAKS_VENTETID)
+    return min(BACKOFF * 2 ** forsok, MAKS_VENTETID)
+
+
+def hent_side(sesjon, url, params=None):
+    # GET med backoff på struping og brot i sambandet, andre HTTP-feil går rett vidare
+    for forsok in range(MAKS_FORSOK):
+        try:
+            r = sesjon.get(url, params=params, timeout=TIDSAVBRUDD)
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(_ventetid(forsok))
+            continue
+        if r.status_code in STRUPING:
+            time.sleep(_ventetid(forsok, r))
+            continue
+        r.raise_for_status()
+        return r.json()
+    raise NedlastingsFeil(f'Gav opp etter {MAKS_FORSOK} forsøk mot {url}')
+
+
+def _sjekkpunkt(mappe, sti, params):
+    nokkel = json.dumps([sti, sorted(params.items())], ensure_ascii=False, default=str)
+    return os.path.join(mappe, hashlib.sha1(nokkel.encode('utf-8')).hexdigest())
+
+
+def _les_status(mappe):
+    try:
+        with open(os.path.join(mappe, 'status.json'), encoding='utf-8') as f:
+            status = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if datetime.now() - datetime.fromisoformat(status['starta']) > MAKS_SJEKKPUNKT_ALDER:
+        return None
+    return status
+
+
+def _skriv_status(mappe, status):
+    tmp = os.path.join(mappe, 'status.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(status, f, indent=4)
+    os.replace(tmp, os.path.join(mappe, 'status.json'))
+
+
+def _laas(mappe, maks_alder=MAKS_LAAS_ALDER):
+    # Eitt sjekkpunkt per spørring, så to nedlastingar av same spørring (to brukarar eller
+    # to jobbar) må ikkje skrive i same mappe. Låsfila blir laga atomisk, og ein lås som
+    # ikkje er fornya innan maks_alder blir teken over.
+    laas = mappe + '.laas'
+    os.makedirs(os.path.dirname(laas), exist_ok=True)
+    for _ in range(2):
+        try:
+            os.close(os.open(laas, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return laas
+        except FileExistsError:
+            try:
+                alder = time.time() - os.path.getmtime(laas)
+            except FileNotFoundError:
+                continue
+            if alder < maks_alder.total_seconds():
+                return None
+            try:
+                os.remove(laas)
+            except FileNotFoundError:
+                pass
+    return None
+
+
+def les_sider(sti, params, tolk_side, sjekkpunktmappe=None, api=NVDB_API, sesjon=None):
+    # Blar gjennom alle sidene for sti og gir tolk_side(objekter) -> DataFrame for kvar side.
+    # Med sjekkpunktmappe blir kvar ferdige side og pagineringsmarkøren lagra på disk,
+    # og ei avbroten nedlasting held fram frå siste sjekkpunkt neste gong. Held ei anna
+    # nedlasting på med same spørring, blir denne køyrd utan sjekkpunkt.
+    sesjon = sesjon or lag_sesjon()
+    params = {**params, 'antall': SIDESTORLEIK}
+    mappe = _sjekkpunkt(sjekkpunktmappe, sti, params) if sjekkpunktmappe else None
+    laas = _laas(mappe) if mappe else None
+    try:
+        return _les_sider(f'{api}/{sti}', params, tolk_side, mappe if laas else None, sesjon)
+    finally:
+        if laas:
+            try:
+                os.remove(laas)
+            except FileNotFoundError:
+                pass
+
+
+def _les_sider(url, params, tolk_side, mappe, sesjon):
+    import pandas as pd
+    neste_params = params
+    sider = []
+
+    status = _les_status(mappe) if mappe else None
+    if status:
+        sider = [pd.read_parquet(os.path.join(mappe, f'side_{i:05d}.parquet')) for i in range(status['sider'])]
+        if status['neste']:
+            url, neste_params = status['neste'], None
+        else:
+            url = None
+    elif mappe:
+        shutil.rmtree(mappe, ignore_errors=True)
+        os.makedirs(mappe)
+        status = {'starta': datetime.now().isoformat(timespec='seconds'), 'sider': 0, 'neste': url}
+        _skriv_status(mappe, status)
+
+    while url:
+        data = hent_side(sesjon, url, neste_params)
+        objekter = data.get('objekter', [])
+        metadata = data.get('metadata', {})
+        if objekter:
+            side = tolk_side(objekter)
+            sider.append(side)
+        neste = metadata.get('neste', {}).get('href') if metadata.get('returnert', len(objekter)) > 0 else None
+        if mappe:
+            if objekter:
+                side.to_parquet(os.path.join(mappe, f'side_{status["sider"]:05d}.parquet'), index=False)
+                status['sider'] += 1
+            status['neste'] = neste
+            _skriv_status(mappe, status)
+            os.utime(mappe + '.laas')
+        url, neste_params = neste, None
+
+    if mappe:
+        shutil.rmtree(mappe, ignore_errors=True)
+    return sider
@@ -3,6 +3,20 @@ import streamlit as st
 import pandas as pd
 from io import BytesIO
 from datetime import datetime
+from nvdbskred.tidtaking import tidtatt
+
+@tidtatt('aggregering')
+def skred_kube(data_df):
+    # Tel hendingar per år, månad, skredtype og løsneområde éin gong, alle
+    # diagramma blir teikna frå denne tabellen i staden for frå rådata
+    if 'antall' in data_df:
+        return data_df
+    kube = data_df.groupby([
+        data_df['Skred_dato'].dt.year.astype('Int16').rename('aar'),
+        data_df['Skred_dato'].dt.month.astype('Int8').rename('maaned'),
+        'Type_skred',
+        'Løsneområde'], observed=True, dropna=False).size()
+    return kube[kube > 0].reset_index(name='antall')
 
 def skred_type_by_month(data_df):
     color_map = {
@@ -15,28 +29,26 @@ def skred_type_by_month(data_df):
         'Sørpeskred (vann+snø+stein)' : 'rgb(201, 165, 117)',
     }
     month_mapping = {
-        'January': 'Januar',
-        'February': 'Februar',
-        'March': 'Mars',
-        'April': 'April',
-        'May': 'Mai',
-        'June': 'Juni',
-        'July': 'Juli',
-        'August': 'August',
-        'September': 'September',
-        'October': 'Oktober',
-        'November': 'November',
-        'December': 'Desember'
+        1: 'Januar',
+        2: 'Februar',
+        3: 'Mars',
+        4: 'April',
+        5: 'Mai',
+        6: 'Juni',
+        7: 'Juli',
+        8: 'August',
+        9: 'September',
+        10: 'Oktober',
+        11: 'November',
+        12: 'Desember'
     }
 
-    # Create a month column
-    data_df['month'] = data_df.loc[:,'Skred_dato'].dt.strftime('%B')
-    
-    # Translate month names to Norwegian
-    data_df.loc[:, 'month'] = data_df.loc[:,'month'].map(month_mapping)
-
     # Group data by month and type and count occurrences
-    data_grouped = data_df.groupby(['month', 'Type_skred']).size().reset_index(name='count')
+    kube = skred_kube(data_df)
+    data_grouped = kube.dropna(subset=['maaned', 'Type_skred']).groupby(['maaned', 'Type_skred'], observed=True)['antall'].sum().reset_index(name='count')
+
+    # Translate month numbers to Norwegian names
+    data_grouped['month'] = data_grouped['maaned'].astype(int).map(month_mapping)
 
     # Color mapping
     #
@@ -83,7 +95,9 @@ def skred_type_counts(data_df):
     }
 
     # Aggregating the data
-    skred_counts = data_df['Type_skred'].value_counts().reset_index()
+    kube = skred_kube(data_df)
+    skred_counts = kube.dropna(subset=['Type_skred']).groupby('Type_skred', observed=True)['antall'].sum()
+    skred_counts = skred_counts[skred_counts > 0].sort_values(ascending=False).reset_index()
     skred_counts.columns = ['Type_skred', 'count']
 
     # Main bar chart
@@ -137,13 +151,10 @@ def plot(data_df):
         'Snø' : 'rgb(255,255,255)',
         'Sørpeskred (vann+snø+stein)' : 'rgb(201, 165, 117)',}
     
-    data = data_df.pivot_table(
-        index=data_df.Skred_dato.dt.year,
-        columns='Type_skred',
-        aggfunc='size')
-    #data = data.fillna(0)
-    
-    data_long = data.reset_index().melt(id_vars='Skred_dato', value_name='count', var_name='Type_skred')
+    kube = skred_kube(data_df)
+    data_long = kube.dropna(subset=['aar', 'Type_skred']).groupby(['aar', 'Type_skred'], observed=True)['antall'].sum().reset_index()
+    data_long.columns = ['Skred_dato', 'Type_skred', 'count']
+    data_long['Skred_dato'] = data_long['Skred_dato'].astype(int)
 
 
     chart = alt.Chart(data_long).mark_bar().encode(
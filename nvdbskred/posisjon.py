@@ -0,0 +1,55 @@
+import os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from nvdbskred.nedlaster import NVDB_API, lag_sesjon
+from nvdbskred.databehandling import MAKS_TRAADER
+
+TIDSAVBRUDD = 10
+
+# Koordinatar blir runda av før oppslag, 4 desimalar i grader er om lag 5-10 meter,
+# så små flyttingar av ein markør gir treff i bufferen i staden for nytt kall
+AVRUNDING = {4326: 4}
+
+
+def _sesjon():
+    # Éin sesjon med keep-alive og connection pool som blir delt mellom trådane
+    sesjon = lag_sesjon(MAKS_TRAADER)
+    forsok = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                   allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAKS_TRAADER, max_retries=forsok)
+    sesjon.mount('https://', adapter)
+    sesjon.mount('http://', adapter)
+    return sesjon
+
+
+sesjon = _sesjon()
+
+
+@lru_cache(maxsize=int(os.environ.get('NVDBSKRED_POSISJONBUFFER', 4096)))
+def _vegref(nord, ost, maks_avstand, srid):
+    r = sesjon.get(f'{NVDB_API}/posisjon', timeout=TIDSAVBRUDD, params={
+        'lat': nord, 'lon': ost, 'maks_avstand': maks_avstand, 'maks_antall': 1, 'srid': srid})
+    data = r.json()
+    vegreferanse = {
+        'kortform' : data[0]['vegsystemreferanse']['kortform'],
+        'vegkategori' : data[0]['vegsystemreferanse']['vegsystem']['vegkategori'],
+        'fase' : data[0]['vegsystemreferanse']['vegsystem']['fase'],
+        'nummer' : data[0]['vegsystemreferanse']['vegsystem']['nummer'],
+        'strekning' : data[0]['vegsystemreferanse']['strekning']['strekning'],
+        'delstrekning' : data[0]['vegsystemreferanse']['strekning']['delstrekning'],
+        'meter' : data[0]['vegsystemreferanse']['strekning']['meter']
+    }
+    return vegreferanse
+
+
+def vegref(nord, ost, maks_avstand=50, srid=4326):
+    desimalar = AVRUNDING.get(srid, 0)
+    return dict(_vegref(round(nord, desimalar), round(ost, desimalar), maks_avstand, srid))
+
+
+def vegref_mange(punkt, maks_avstand=50, srid=4326, maks_traader=MAKS_TRAADER):
+    # Slår opp ei liste med (nord, ost) samtidig, i same rekkefølgje som punkta
+    with ThreadPoolExecutor(max_workers=maks_traader) as pool:
+        return list(pool.map(lambda p: vegref(p[0], p[1], maks_avstand, srid), punkt))
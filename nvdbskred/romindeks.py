@@ -0,0 +1,52 @@
+import numpy as np
+import shapely
+from nvdbskred.geometri import til_kartsystem
+from nvdbskred.tidtaking import tidtatt
+
+# Lange søkelinjer har ein stor bbox som dekker mykje av treet, så dei blir delte
+# i bitar med denne lengda (meter) før søket
+DELLENGD = 1000
+
+
+def _korte_linjer(geometri):
+    # Linjene blir delte i korte linjestykke, anna geometri blir brukt som den er
+    deler = shapely.get_parts(geometri)
+    linje = np.isin(shapely.get_type_id(deler), [1])
+    koordinatar, nummer = shapely.get_coordinates(shapely.segmentize(deler[linje], DELLENGD), return_index=True)
+    samanheng = nummer[:-1] == nummer[1:]
+    stykke = shapely.linestrings(np.stack([koordinatar[:-1][samanheng], koordinatar[1:][samanheng]], axis=1))
+    return np.concatenate([deler[~linje], stykke])
+
+
+class Romindeks:
+    # STRtree over geometrien i eit datasett (UTM). Svara er indeksetikettar, som følgjer
+    # med radene når datasettet seinare blir filtrert eller får kolonner fjerna.
+    def __init__(self, df):
+        self.tre = shapely.STRtree(np.asarray(df['geometry'].values))
+        self.etikettar = df.index.to_numpy()
+
+    def naer(self, geometri, avstand=0):
+        # Rader som ligg innanfor avstand meter frå ein av geometriane, 0 gir dei som skjer
+        geometri = _korte_linjer(np.atleast_1d(geometri))
+        if avstand > 0:
+            _, treff = self.tre.query(geometri, predicate='dwithin', distance=avstand)
+        else:
+            _, treff = self.tre.query(geometri, predicate='intersects')
+        return self.etikettar[np.unique(treff)]
+
+    def radius(self, x, y, avstand):
+        return self.naer(shapely.points(x, y), avstand)
+
+    def boks(self, minx, miny, maxx, maxy):
+        return self.naer(shapely.box(minx, miny, maxx, maxy))
+
+    @tidtatt('romleg utval')
+    def utval(self, df, geometri, avstand=0):
+        # Radene i df (datasettet indeksen er bygd på, eller eit utval av det) nær geometrien
+        return df[df.index.isin(self.naer(geometri, avstand))]
+
+
+def teikningar(teikna):
+    # GeoJSON-features frå Draw-tillegget (WGS 84) til geometri i kartsystemet
+    geometriar = np.array([shapely.geometry.shape(f['geometry']) for f in teikna], dtype=object)
+    return til_kartsystem(geometriar)
@@ -0,0 +1,171 @@
+import json
+import numpy as np
+import pandas as pd
+import shapely
+import folium
+from branca.colormap import LinearColormap
+from branca.element import MacroElement
+from jinja2 import Template
+from pyproj import Transformer
+from nvdbskred.geometri import KARTSYSTEM, til_wgs84
+from nvdbskred.tidtaking import tidtatt
+
+# Rutestorleik i meter (avstand mellom rutemidtpunkt) og lågaste zoom ruta blir vist på.
+# Kvar storleik blir vist frå sin zoom til neste, den finaste så langt inn som mogleg.
+RUTESTORLEIKAR = {50000: 0, 20000: 6, 5000: 8, 1000: 10}
+
+# Ein oppløysing med fleire ruter enn dette blir ikkje sendt, så kartet held seg
+# på om lag same storleik uansett kor mange skred som er valt
+MAKS_RUTER = 5000
+
+# Over så mange rader blir rutenettet vist på låg zoom
+RUTENETTGRENSE = 5000
+
+# Over så mange rader sender linjekartet utan vektorfliser berre rutenettet til nettlesaren
+RAADATAGRENSE = 20000
+
+# Zoom der rutenettet blir bytt ut med linjer eller punkt, når dei er med
+DETALJZOOM = 11
+
+FORMER = ['hex', 'kvadrat']
+
+_SQRT3 = np.sqrt(3)
+
+
+def kartkoordinatar(df):
+    # Midtpunkta i kartsystemet (UTM), frå midtpunkta i WGS 84 som klargjer_geometri har rekna ut
+    transformer = Transformer.from_crs('EPSG:4326', KARTSYSTEM, always_xy=True)
+    return transformer.transform(df['midt_lon'].to_numpy(np.float64), df['midt_lat'].to_numpy(np.float64))
+
+
+def _hexrute(x, y, storleik):
+    # Hexagon med spissen opp og storleik mellom midtpunkta, aksiale koordinatar (q, r)
+    # med avrunding i kubekoordinatar
+    radius = storleik / _SQRT3
+    q = (_SQRT3 / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    rq = np.where((dq > dr) & (dq > ds), -rr - rs, rq)
+    rr = np.where(~((dq > dr) & (dq > ds)) & (dr > ds), -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def _hexpolygon(q, r, storleik):
+    radius = storleik / _SQRT3
+    cx = radius * _SQRT3 * (q + r / 2)
+    cy = radius * 1.5 * r
+    vinkel = np.radians(60 * np.arange(7) - 30)
+    return shapely.polygons(np.stack([cx[:, None] + radius * np.cos(vinkel),
+                                      cy[:, None] + radius * np.sin(vinkel)], axis=-1))
+
+
+def _kvadratrute(x, y, storleik):
+    return np.floor(x / storleik).astype(np.int64), np.floor(y / storleik).astype(np.int64)
+
+
+def _kvadratpolygon(i, j, storleik):
+    return shapely.box(i * storleik, j * storleik, (i + 1) * storleik, (j + 1) * storleik)
+
+
+@tidtatt('rutenett')
+def rutenett(df, storleik, form='hex', koordinatar=None):
+    # Tal på skred per rute og per Type_skred, med rutene som polygon i WGS 84
+    x, y = koordinatar if koordinatar is not None else kartkoordinatar(df)
+    gyldig = np.isfinite(x) & np.isfinite(y)
+    a, b = (_hexrute if form == 'hex' else _kvadratrute)(x[gyldig], y[gyldig], storleik)
+    typar = df['Type_skred'].astype('category')
+    kode = typar.cat.codes.to_numpy()[gyldig].astype(np.int64) + 1
+    # a og b er små nok til å pakkast i eitt heiltal per rute
+    rute, invers = np.unique(a * 2 ** 32 + b, return_inverse=True)
+    talle = np.bincount(invers * (len(typar.cat.categories) + 1) + kode,
+                        minlength=len(rute) * (len(typar.cat.categories) + 1))
+    celler = pd.DataFrame(talle.reshape(len(rute), -1), columns=['Ukjent'] + list(typar.cat.categories))
+    celler = celler.loc[:, celler.sum() > 0]
+    celler.insert(0, 'antall', celler.sum(axis=1))
+    a, b = (rute + 2 ** 31) // 2 ** 32, (rute + 2 ** 31) % 2 ** 32 - 2 ** 31
+    polygon = (_hexpolygon if form == 'hex' else _kvadratpolygon)(a, b, storleik)
+    celler['geometry'] = shapely.set_precision(til_wgs84(polygon), 1e-5)
+    return celler
+
+
+def nivaa(df, form='hex', maks_ruter=MAKS_RUTER):
+    # Rutenett frå grovaste til finaste oppløysing, stoppar ved første som har for mange ruter
+    koordinatar = kartkoordinatar(df)
+    nivaaliste = []
+    for storleik, zoom in RUTESTORLEIKAR.items():
+        celler = rutenett(df, storleik, form, koordinatar)
+        if len(celler) > maks_ruter and nivaaliste:
+            break
+        nivaaliste.append((storleik, zoom, celler))
+    return nivaaliste
+
+
+def _geojson(celler):
+    typar = [k for k in celler.columns if k not in ('antall', 'geometry')]
+    tekst = [f'{rad[0]} skred<br>' + '<br>'.join(f'{t}: {n}' for t, n in zip(typar, rad[1:]) if n)
+             for rad in celler[['antall'] + typar].itertuples(index=False)]
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': json.loads(shapely.to_geojson(geometri)),
+         'properties': {'antall': int(antall), 'tekst': t}}
+        for geometri, antall, t in zip(celler['geometry'], celler['antall'], tekst)]}
+
+
+def tettleikslag(celler, namn):
+    # Rutene farga etter talet på skred, på logaritmisk skala
+    storst = max(int(celler['antall'].max()), 2) if len(celler) else 2
+    fargar = LinearColormap(['#ffffb2', '#fecc5c', '#fd8d3c', '#f03b20', '#bd0026'], vmin=0, vmax=np.log(storst))
+    lag = folium.FeatureGroup(name=namn)
+    folium.GeoJson(
+        _geojson(celler),
+        style_function=lambda f: {'fillColor': fargar(np.log(f['properties']['antall'])), 'color': '#555555',
+                                  'weight': 0.3, 'fillOpacity': 0.6},
+        tooltip=folium.GeoJsonTooltip(fields=['tekst'], labels=False),
+    ).add_to(lag)
+    return lag
+
+
+class Zoomlag(MacroElement):
+    # Viser kvart lag berre mellom sin minste og største zoom
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var kart = {{ this._parent.get_name() }};
+            var lag = [{% for lag, fra, til in this.lag %}[{{ lag.get_name() }}, {{ fra }}, {{ til }}],{% endfor %}];
+            function oppdater() {
+                var zoom = kart.getZoom();
+                lag.forEach(function (l) {
+                    var synleg = zoom >= l[1] && zoom <= l[2];
+                    if (synleg && !kart.hasLayer(l[0])) { kart.addLayer(l[0]); }
+                    if (!synleg && kart.hasLayer(l[0])) { kart.removeLayer(l[0]); }
+                });
+            }
+            kart.on('zoomend', oppdater);
+            oppdater();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, lag):
+        super().__init__()
+        self._name = 'Zoomlag'
+        self.lag = lag
+
+
+def legg_til_rutenett(m, df, detaljar=None, form='hex'):
+    # Rutenett på låg zoom. detaljar er laget med linjer eller punkt, som tek over frå
+    # DETALJZOOM, eller None når berre rutenettet skal sendast.
+    nivaaliste = nivaa(df, form)
+    zoomar = [zoom for _, zoom, _ in nivaaliste[1:]] + [DETALJZOOM if detaljar is not None else 99]
+    lag = []
+    for (storleik, zoom, celler), neste in zip(nivaaliste, zoomar):
+        til = min(neste, DETALJZOOM if detaljar is not None else 99) - 1
+        lag.append((tettleikslag(celler, f'Skred per {storleik / 1000:g} km'), zoom, til))
+    if detaljar is not None:
+        lag.append((detaljar, DETALJZOOM, 99))
+    for l, _, _ in lag:
+        l.add_to(m)
+    Zoomlag(lag).add_to(m)
+    m.fit_bounds([[df['midt_lat'].min(), df['midt_lon'].min()], [df['midt_lat'].max(), df['midt_lon'].max()]])
+    return m
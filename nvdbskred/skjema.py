@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Kolonner med kodeliste i NVDB, og namnet på egenskapstypen i datakatalogen
+KODELISTER = {
+    'Type_skred': 'Type skred',
+    'Volum_av_skredmasser_på_veg': 'Volum av skredmasser på veg',
+    'Løsneområde': 'Løsneområde',
+    'Værforhold_på_vegen': 'Værforhold på vegen',
+}
+
+# Fritekst blir lagra som Arrow-strengar i staden for Python-objekt
+TEKST = ['Stedsangivelse', 'geometri', 'vref']
+
+TEKSTTYPE = pd.StringDtype('pyarrow')
+
+HEILTAL = {'nvdbId': np.int64, 'fylke': np.int16}
+
+FLYTTAL = {'Blokkert_veglengde': np.float32}
+
+
+def kategoritype(kolonne, verdiar=()):
+    # Fast rekkefølgje frå kodelista, verdiar som ikkje står i lista blir lagt til sist
+    kjende = list(verdiar)
+    ukjende = sorted(set(kolonne.dropna().astype(str)) - set(kjende))
+    return pd.CategoricalDtype(kjende + ukjende)
+
+
+def bruk_skjema(df, kodelister=None):
+    # Gir datasettet faste, kompakte kolonnetypar. kodelister er {kolonne: [tillatne verdiar]}.
+    # Kolonner som alt har rett type blir ikkje rørt, så delte datasett ikkje blir kopierte.
+    kodelister = kodelister or {}
+    df = df.copy(deep=False)
+    for kolonne in KODELISTER:
+        if kolonne not in df:
+            continue
+        kategorisk = isinstance(df[kolonne].dtype, pd.CategoricalDtype)
+        if kategorisk and kolonne not in kodelister:
+            continue
+        kjende = kodelister.get(kolonne) or (list(df[kolonne].cat.categories) if kategorisk else ())
+        verdiar = df[kolonne].astype(object).where(df[kolonne].notna(), None)
+        df[kolonne] = pd.Categorical(verdiar, dtype=kategoritype(verdiar, kjende))
+    if 'kontraktsomrader' in df and not isinstance(df['kontraktsomrader'].dtype, pd.CategoricalDtype):
+        df['kontraktsomrader'] = df['kontraktsomrader'].astype('category')
+    typar = {**{kolonne: TEKSTTYPE for kolonne in TEKST}, **HEILTAL}
+    for kolonne, dtype in typar.items():
+        if kolonne in df and df[kolonne].dtype != dtype:
+            df[kolonne] = df[kolonne].astype(dtype)
+    for kolonne, dtype in FLYTTAL.items():
+        if kolonne in df and df[kolonne].dtype != dtype:
+            df[kolonne] = pd.to_numeric(df[kolonne], errors='coerce').astype(dtype)
+    return df
+
+
+def minnebruk(df):
+    # Bytes brukt av datasettet, inkludert strengar og geometri
+    return int(df.memory_usage(deep=True).sum())
+
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from nvdbskred.vegreferanse import UKJEND_POSISJON, _NUMMER, _STREKNING, vegnamn
+from nvdbskred.tidtaking import tidtatt
+
+# Par (rad, årspar) som blir handsama om gongen i trendrekninga. Kvar rad gir
+# år * (år - 1) / 2 par, så blokka blir mindre når datasettet går over mange år.
+# 4 millionar par er 32 MB per mellomresultat.
+PARBLOKK = 4_000_000
+
+KOLONNER = ['segment', 'veg', 'strekning', 'fra_meter', 'til_meter', 'Løsneområde', 'antall', 'aar_med_skred',
+            'per_aar', 'sannsyn_per_aar', 'gjentaksintervall', 'maks_per_aar', 'trend', 'p_trend']
+
+
+def segment(df, bitlengd=None):
+    # Segmentnøkkel langs vegen: heile strekningar, eller bitar på bitlengd meter som i analyse.skredpunkt
+    posisjon = df['vegposisjon'].to_numpy()
+    midt = (posisjon + df['vegposisjon_til'].to_numpy()) // 2
+    nokkel = midt // (bitlengd or _STREKNING)
+    return np.where(posisjon == UKJEND_POSISJON, -1, nokkel)
+
+
+def telmatrise(df, bitlengd=None, periode=None):
+    # Tal på skred per (segment, løsneområde) og år, éi rad per kombinasjon med minst eitt skred.
+    # periode er (første, siste) år, utan periode går åra frå første til siste skred.
+    seg = segment(df, bitlengd)
+    aar = df['Skred_dato'].dt.year.to_numpy(dtype=np.float64, na_value=np.nan)
+    losne = df['Løsneområde'].astype('category')
+    kode = losne.cat.codes.to_numpy().astype(np.int64)
+    gyldig = (seg >= 0) & ~np.isnan(aar)
+    if periode is not None:
+        gyldig &= (aar >= periode[0]) & (aar <= periode[1])
+    if not gyldig.any():
+        return np.zeros((0, 0), np.int32), np.zeros(0, np.int64), np.zeros(0, np.int64), losne.cat.categories, 0
+    aar = aar[gyldig].astype(np.int64)
+    forste, siste = periode if periode is not None else (aar.min(), aar.max())
+    ant_aar = siste - forste + 1
+    # Løsneområde -1 (ukjent) blir flytta til 0, dei andre ein opp
+    rad, invers = np.unique(seg[gyldig] * (len(losne.cat.categories) + 1) + kode[gyldig] + 1, return_inverse=True)
+    matrise = np.bincount(invers * ant_aar + (aar - forste), minlength=len(rad) * ant_aar)
+    return (matrise.reshape(len(rad), ant_aar).astype(np.int32), rad // (len(losne.cat.categories) + 1),
+            rad % (len(losne.cat.categories) + 1) - 1, losne.cat.categories, forste)
+
+
+def _trend(matrise):
+    # Sen-stigning (median av alle parvise stigningar) og Mann-Kendall-test med
+    # korreksjon for like verdiar, for alle rader samstundes i blokker
+    rader, ant_aar = matrise.shape
+    i, j = np.triu_indices(ant_aar, 1)
+    stigning = np.empty(rader)
+    s = np.empty(rader)
+    blokkrader = max(1, PARBLOKK // len(i))
+    for start in range(0, rader, blokkrader):
+        blokk = matrise[start:start + blokkrader]
+        skilnad = (blokk[:, j] - blokk[:, i]).astype(np.float64)
+        stigning[start:start + blokkrader] = np.median(skilnad / (j - i), axis=1)
+        s[start:start + blokkrader] = np.sign(skilnad).sum(axis=1)
+    # Grupper av like verdiar per rad: t(t - 1)(2t + 5) summert over verdiane
+    like = np.bincount((np.arange(rader)[:, None] * (matrise.max() + 1) + matrise).ravel(),
+                       minlength=rader * (matrise.max() + 1)).reshape(rader, -1)
+    varians = (ant_aar * (ant_aar - 1) * (2 * ant_aar + 5) - (like * (like - 1) * (2 * like + 5)).sum(axis=1)) / 18
+    z = np.where(varians > 0, (s - np.sign(s)) / np.sqrt(np.where(varians > 0, varians, 1)), 0)
+    return stigning, 2 * stats.norm.sf(np.abs(z))
+
+
+def periode(df, fradato=None, tildato=None):
+    # Åra statistikken blir rekna over: frå fradato og til tildato når dei er valde,
+    # elles frå første eller til siste skred i datasettet
+    dato = df['Skred_dato'].dropna()
+    if dato.empty and (fradato is None or tildato is None):
+        return None
+    fra = pd.Timestamp(fradato).year if fradato is not None else dato.min().year
+    til = pd.Timestamp(tildato).year if tildato is not None else dato.max().year
+    return fra, til
+
+
+@tidtatt('frekvens')
+def frekvens(df, bitlengd=None, fradato=None, tildato=None):
+    # Årleg rate, empirisk gjentaksintervall og trend per vegsegment og løsneområde.
+    # Åra er alle år i perioden, også år utan skred, sjå periode.
+    if fradato is not None:
+        df = df[df['Skred_dato'] >= fradato]
+    if tildato is not None:
+        df = df[df['Skred_dato'] <= tildato]
+    matrise, seg, losne, kategoriar, forste = telmatrise(df, bitlengd, periode(df, fradato, tildato))
+    if not len(matrise):
+        return pd.DataFrame(columns=KOLONNER)
+    ant_aar = matrise.shape[1]
+    antall = matrise.sum(axis=1)
+    aar_med_skred = (matrise > 0).sum(axis=1)
+    trend, p_trend = _trend(matrise) if ant_aar > 2 else (np.zeros(len(matrise)), np.ones(len(matrise)))
+
+    meter = seg * (bitlengd or _STREKNING)
+    strekning = meter // _STREKNING
+    resultat = pd.DataFrame({
+        'segment': seg,
+        'veg': vegnamn(strekning * _STREKNING // _NUMMER),
+        'strekning': (strekning % (_NUMMER // _STREKNING)).astype(np.int32),
+        'fra_meter': (meter % _STREKNING).astype(np.int32),
+        'til_meter': (meter % _STREKNING + (bitlengd or 0)).astype(np.int32),
+        'Løsneområde': pd.Categorical.from_codes(losne, categories=kategoriar),
+        'antall': antall.astype(np.int32),
+        'aar_med_skred': aar_med_skred.astype(np.int32),
+        'per_aar': antall / ant_aar,
+        'sannsyn_per_aar': aar_med_skred / ant_aar,
+        # Weibull-plotteposisjon: eitt år med skred kjem i snitt kvart (n + 1) / m år
+        'gjentaksintervall': (ant_aar + 1) / aar_med_skred,
+        'maks_per_aar': matrise.max(axis=1).astype(np.int32),
+        'trend': trend,
+        'p_trend': p_trend,
+    })
+    if not bitlengd:
+        resultat = resultat.drop(columns=['fra_meter', 'til_meter'])
+    resultat.attrs['aar'] = (int(forste), int(forste + ant_aar - 1))
+    return resultat.sort_values('per_aar', ascending=False, ignore_index=True)
+
+
+def utval(statistikk, df, bitlengd=None, losneomrade=None):
+    # Radene i statistikken for segmenta i df, og eventuelt berre for valde løsneområde
+    maske = np.isin(statistikk['segment'].to_numpy(), segment(df, bitlengd))
+    if losneomrade is not None:
+        maske &= statistikk['Løsneområde'].isin(losneomrade).to_numpy()
+    return statistikk[maske]
@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+import pandas as pd
+
+# Kvart steg blir logga som éi JSON-linje på denne loggaren
+logger = logging.getLogger('nvdbskred.tidtaking')
+
+# NVDBSKRED_TIDTAKING=1 skriv loggen til stderr også når appen ikkje set opp logging sjølv
+if os.environ.get('NVDBSKRED_TIDTAKING') and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+_maalingar = contextvars.ContextVar('maalingar', default=None)
+
+
+def _storleik(post, df):
+    if isinstance(df, pd.DataFrame):
+        post['rader'] = len(df)
+        post['bytes'] = int(df.memory_usage(index=False).sum())
+
+
+@contextmanager
+def steg(namn, **felt):
+    # Tek tida på eit steg. Rader og bytes kan setjast i den returnerte posten undervegs.
+    post = {'steg': namn, **felt}
+    start = time.perf_counter()
+    try:
+        yield post
+    finally:
+        post['sekund'] = round(time.perf_counter() - start, 4)
+        logger.info(json.dumps(post, ensure_ascii=False, default=str))
+        maalingar = _maalingar.get()
+        if maalingar is not None:
+            maalingar.append(post)
+
+
+def tidtatt(namn):
+    # Dekoratør som tek tida på funksjonen, med rader og bytes for DataFrame-resultat,
+    # eller for første DataFrame-argument når resultatet ikkje er ein DataFrame
+    def dekorator(funksjon):
+        @functools.wraps(funksjon)
+        def innpakka(*args, **kwargs):
+            with steg(namn) as post:
+                resultat = funksjon(*args, **kwargs)
+                if isinstance(resultat, pd.DataFrame):
+                    _storleik(post, resultat)
+                else:
+                    _storleik(post, next((a for a in args if isinstance(a, pd.DataFrame)), None))
+                return resultat
+        return innpakka
+    return dekorator
+
+
+@contextmanager
+def oppsamling():
+    # Samlar måla steg i denne tråden/konteksten i ei liste, i tillegg til loggen
+    maalingar = []
+    token = _maalingar.set(maalingar)
+    try:
+        yield maalingar
+    finally:
+        _maalingar.reset(token)
+
+
+def tidtabell(maalingar):
+    tabell = pd.DataFrame(maalingar, columns=['steg', 'sekund', 'rader', 'bytes'])
+    tabell['MB'] = (tabell['bytes'] / 1024 ** 2).round(2)
+    return tabell.drop(columns=['bytes'])
@@ -0,0 +1,126 @@
+import re
+import numpy as np
+import pandas as pd
+from nvdbskred.tidtaking import tidtatt
+
+# Vegsystemreferanse slik den blir gitt inn i filteret, f.eks Ev, Rv5, Fv53S2-4, Rv5 S8D1
+VEGFILTER = re.compile(r'^\s*([ERFKPS])([VAPF])?\s*(\d+)?\s*(?:S(\d+)(?:\s*-\s*(\d+))?(?:D\d+)?)?\s*$', re.IGNORECASE)
+
+# Kortform frå NVDB, f.eks "RV5 S8D1 m1234-1300"
+VREF = r'^([ERFKPS])([VAPF])(\d+)\s+S(\d+)D(\d+)(?:\s+m(\d+)(?:-(\d+))?)?'
+
+VEGKATEGORIAR = ['E', 'R', 'F', 'K', 'P', 'S']
+
+# Sorteringsnøkkel for posisjon langs vegen: vegkategori, vegnummer, strekning og meter
+# pakka i eitt heiltal, slik at ein strekning er eit samanhengande intervall
+_NUMMER = 10 ** 10
+_KATEGORI = 10 ** 5 * _NUMMER
+_STREKNING = 10 ** 7
+UKJEND_POSISJON = np.iinfo(np.int64).max
+
+# Hjelpekolonner for indeksen, skal ikkje med i nedlasting
+INDEKSKOLONNER = ['vegposisjon', 'vegposisjon_til']
+
+
+def tolk_vegfilter(tekst):
+    treff = VEGFILTER.match(str(tekst))
+    if not treff:
+        return None
+    kategori, fase, nummer, fra, til = treff.groups()
+    return {
+        'kategori': kategori.upper(),
+        'fase': fase.upper() if fase else None,
+        'nummer': int(nummer) if nummer else None,
+        'strekning_fra': int(fra) if fra else None,
+        'strekning_til': int(til) if til else (int(fra) if fra else None),
+    }
+
+
+def vegfilter_dekker(vid, smal):
+    # True om alt som matchar vegfilteret smal også matchar vid
+    if vid is None or smal is None:
+        return False
+    if vid['kategori'] != smal['kategori']:
+        return False
+    if vid['fase'] and vid['fase'] != smal['fase']:
+        return False
+    if vid['nummer'] is not None and vid['nummer'] != smal['nummer']:
+        return False
+    if vid['strekning_fra'] is not None:
+        if smal['strekning_fra'] is None:
+            return False
+        return vid['strekning_fra'] <= smal['strekning_fra'] and smal['strekning_til'] <= vid['strekning_til']
+    return True
+
+
+def vref_deler(vref):
+    deler = vref.astype(object).str.extract(VREF, flags=re.IGNORECASE)
+    deler.columns = ['vegkategori', 'fase', 'vegnummer', 'strekning', 'delstrekning', 'fra_meter', 'til_meter']
+    for kolonne in ['vegnummer', 'strekning', 'delstrekning', 'fra_meter', 'til_meter']:
+        deler[kolonne] = pd.to_numeric(deler[kolonne]).astype('Int32')
+    # Punkt har berre éin meterverdi
+    deler['til_meter'] = deler['til_meter'].fillna(deler['fra_meter'])
+    deler['vegkategori'] = pd.Categorical(deler['vegkategori'].str.upper(), categories=VEGKATEGORIAR)
+    deler['fase'] = deler['fase'].str.upper().astype('category')
+    return deler
+
+
+def vegposisjon(kategori, nummer, strekning, meter):
+    return kategori * _KATEGORI + nummer * _NUMMER + strekning * _STREKNING + meter
+
+
+def vegnamn(veg):
+    # Vegnøkkel (kategori * _KATEGORI + nummer * _NUMMER) til f.eks EV39
+    kategori = np.asarray(VEGKATEGORIAR, dtype=object)[veg // (_KATEGORI // _NUMMER)]
+    return pd.Series(kategori).str.cat(pd.Series(veg % (_KATEGORI // _NUMMER)).astype(str), sep='V').to_numpy()
+
+
+@tidtatt('vref')
+def klargjer_vref(df):
+    # Tolkar vref éin gong ved innlesing til heiltalskolonner, og sorterer datasettet
+    # etter posisjon langs vegen. Utval med boolske masker held på sorteringa, så
+    # strekningssøk blir binærsøk i staden for regex over alle rader.
+    # Rader utan vegposisjon (t.d. frå ein eldre concat) gjer at alt blir tolka på nytt
+    if 'vegposisjon' in df and df['vegposisjon'].notna().all():
+        if df['vegposisjon'].is_monotonic_increasing:
+            return df
+        return df.sort_values('vegposisjon', kind='stable')
+    deler = vref_deler(df['vref'])
+    df = df.assign(**{kolonne: deler[kolonne] for kolonne in deler.columns})
+    kategori = deler['vegkategori'].cat.codes.to_numpy().astype(np.int64)
+    kjent = (kategori >= 0) & deler[['vegnummer', 'strekning', 'fra_meter']].notna().all(axis=1).to_numpy()
+    prefiks = vegposisjon(kategori, deler['vegnummer'].fillna(0).to_numpy(np.int64),
+                          deler['strekning'].fillna(0).to_numpy(np.int64), 0)
+    df['vegposisjon'] = np.where(kjent, prefiks + deler['fra_meter'].fillna(0).to_numpy(np.int64), UKJEND_POSISJON)
+    df['vegposisjon_til'] = np.where(kjent, prefiks + deler['til_meter'].fillna(0).to_numpy(np.int64), UKJEND_POSISJON)
+    return df.sort_values('vegposisjon', kind='stable')
+
+
+@tidtatt('vegstrekning')
+def vegstrekning(df, vegfilter, fra_strekning, fra_meter, til_strekning, til_meter):
+    # Rader på vegen frå (fra_strekning, fra_meter) til (til_strekning, til_meter).
+    # df må vere sortert på vegposisjon, sjå klargjer_vref.
+    if isinstance(vegfilter, str):
+        vegfilter = tolk_vegfilter(vegfilter)
+    if vegfilter is None or vegfilter['nummer'] is None:
+        raise ValueError('Strekningssøk krev vegkategori og vegnummer')
+    kategori = VEGKATEGORIAR.index(vegfilter['kategori'])
+    fra = vegposisjon(kategori, vegfilter['nummer'], int(fra_strekning), int(fra_meter))
+    til = vegposisjon(kategori, vegfilter['nummer'], int(til_strekning), int(til_meter))
+    posisjon = df['vegposisjon'].to_numpy()
+    start, slutt = np.searchsorted(posisjon, fra, side='left'), np.searchsorted(posisjon, til, side='right')
+    utval = df.iloc[start:slutt]
+    return utval[utval['vegposisjon_til'] <= til]
+
+
+def vegfilter_maske(df, vegfilter):
+    # Radvis maske for kva vegsegment som ligg innanfor vegfilteret
+    deler = df if 'vegkategori' in df else vref_deler(df['vref'])
+    maske = deler['vegkategori'] == vegfilter['kategori']
+    if vegfilter['fase']:
+        maske &= deler['fase'] == vegfilter['fase']
+    if vegfilter['nummer'] is not None:
+        maske &= deler['vegnummer'] == vegfilter['nummer']
+    if vegfilter['strekning_fra'] is not None:
+        maske &= deler['strekning'].between(vegfilter['strekning_fra'], vegfilter['strekning_til'])
+    return maske.fillna(False).astype(bool)
@@ -0,0 +1,102 @@
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer
+import pandas as pd
+import pytest
+from benchmarks.stubserver import FYLKER, KONTRAKTER, Handsamar, Kjelde
+from nvdbskred import databehandling
+from nvdbskred.hurtigbuffer import Filterbuffer, filter_dekker, filtrer_lokalt
+from nvdbskred.nedlaster import les_sider
+from nvdbskred.vegreferanse import klargjer_vref
+
+ANTALL = 3000
+
+
+@pytest.fixture(scope='module')
+def stub():
+    class Stub(Handsamar):
+        kjelde = Kjelde(ANTALL)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Stub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+@pytest.fixture
+def hent(stub, monkeypatch):
+    # Skreddata frå stubserveren, klargjort som i appen
+    monkeypatch.setattr(databehandling, 'NVDB_API', stub)
+    monkeypatch.setattr(databehandling, 'les_sider', partial(les_sider, api=stub))
+    databehandling.skredtype_definisjon.cache_clear()
+    databehandling.fylkesinndeling.cache_clear()
+    yield lambda filter: klargjer_vref(databehandling.klargjer(databehandling.hent_objekt(filter, sjekkpunktmappe=None)))
+    databehandling.skredtype_definisjon.cache_clear()
+    databehandling.fylkesinndeling.cache_clear()
+
+
+@pytest.fixture
+def heile(hent):
+    return hent({})
+
+
+def rader(df):
+    return sorted(zip(df['nvdbId'], df['vref']))
+
+
+def vanlegaste_veg(df):
+    veg = df[['vegkategori', 'fase', 'vegnummer']].value_counts().index[0]
+    return f'{veg[0]}{veg[1]}{veg[2]}'
+
+
+def sjekk(hent, df, vid, smal):
+    # Lokal filtrering av datasettet for vid skal gi dei same radene som å spørje NVDB med smal
+    assert filter_dekker(vid, smal, df)
+    lokalt = filtrer_lokalt(df, vid, smal)
+    assert not lokalt.empty
+    assert rader(lokalt) == rader(hent(smal))
+
+
+@pytest.mark.parametrize('fylke', [str(FYLKER[0]), str(FYLKER[-1])])
+def test_fylke(hent, heile, fylke):
+    sjekk(hent, heile, {}, {'fylke': fylke})
+
+
+def test_veg(hent, heile):
+    sjekk(hent, heile, {}, {'vegsystemreferanse': vanlegaste_veg(heile)})
+
+
+def test_strekningsintervall(hent, heile):
+    veg = vanlegaste_veg(heile)
+    sjekk(hent, heile, {}, {'vegsystemreferanse': f'{veg}S3-12'})
+    sjekk(hent, hent({'vegsystemreferanse': veg}), {'vegsystemreferanse': veg},
+          {'vegsystemreferanse': f'{veg}S5'})
+
+
+def test_kontraktsomrade(hent, heile):
+    sjekk(hent, heile, {}, {'kontraktsomrade': KONTRAKTER[0]})
+
+
+def test_fylke_og_veg(hent, heile):
+    fylke = str(heile['fylke'].astype(int).mode()[0])
+    vid = {'fylke': fylke}
+    del_df = hent(vid)
+    sjekk(hent, del_df, vid, {'fylke': fylke, 'vegsystemreferanse': vanlegaste_veg(del_df)})
+
+
+def test_dekker_ikkje():
+    df = pd.DataFrame(columns=['nvdbId', 'fylke', 'kontraktsomrader', 'vref'])
+    assert not filter_dekker({'fylke': '46'}, {}, df)
+    assert not filter_dekker({'fylke': '46'}, {'fylke': '50'}, df)
+    assert not filter_dekker({'vegsystemreferanse': 'EV39S5'}, {'vegsystemreferanse': 'EV39'}, df)
+    assert not filter_dekker({}, {'egenskap': '(2321>="2020-01-01")'}, df)
+    assert not filter_dekker({}, {'kontraktsomrade': KONTRAKTER[0]}, df.drop(columns='kontraktsomrader'))
+
+
+def test_buffer_filtrerer_lokalt(hent, heile):
+    buffer = Filterbuffer()
+    buffer.legg_til({}, heile)
+    smal = {'kontraktsomrade': KONTRAKTER[1]}
+    assert rader(buffer.hent(smal)) == rader(hent(smal))
+    assert buffer.hent({}) is heile
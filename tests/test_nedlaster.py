@@ -0,0 +1,102 @@
+import threading
+from http.server import ThreadingHTTPServer
+import pandas as pd
+import pytest
+from benchmarks.stubserver import Handsamar, Kjelde
+from nvdbskred import nedlaster
+from nvdbskred.nedlaster import NedlastingsFeil, les_sider
+
+ANTALL = 2500
+SIDE = 1000
+
+
+class Stub:
+    # Stubserveren med ein logg over sidene som blir spurde etter. strup er tal på
+    # 429-svar som står att for sida som startar på kvar posisjon.
+    def __init__(self):
+        self.sider = []
+        self.strup = {}
+        self.laas = threading.Lock()
+        stub = self
+
+        class Strupar(Handsamar):
+            kjelde = Kjelde(ANTALL)
+
+            def vegobjekter(self, params):
+                start = int(params.get('start', 0))
+                with stub.laas:
+                    stub.sider.append(start)
+                    strup = stub.strup.get(start, 0) > 0
+                    if strup:
+                        stub.strup[start] -= 1
+                if strup:
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                super().vegobjekter(params)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Strupar)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(nedlaster, 'SIDESTORLEIK', SIDE)
+    monkeypatch.setattr(nedlaster, 'MAKS_FORSOK', 3)
+    monkeypatch.setattr(nedlaster, 'BACKOFF', 0)
+    stub = Stub()
+    yield stub
+    stub.server.shutdown()
+
+
+def tolk(objekter):
+    return pd.DataFrame({'id': [o['id'] for o in objekter]})
+
+
+def ider(sider):
+    return sorted(pd.concat(sider)['id'])
+
+
+def test_struping_blir_prova_paa_nytt(stub):
+    stub.strup = {SIDE: 2}
+    sider = les_sider('vegobjekter/445', {}, tolk, api=stub.url)
+    assert stub.sider == [0, SIDE, SIDE, SIDE, 2 * SIDE, ANTALL]
+    assert ider(sider) == list(range(100000000, 100000000 + ANTALL))
+
+
+def test_held_fram_fraa_sjekkpunkt(stub, tmp_path):
+    stub.strup = {2 * SIDE: nedlaster.MAKS_FORSOK}
+    with pytest.raises(NedlastingsFeil):
+        les_sider('vegobjekter/445', {}, tolk, sjekkpunktmappe=str(tmp_path), api=stub.url)
+    assert stub.sider == [0, SIDE] + [2 * SIDE] * nedlaster.MAKS_FORSOK
+
+    stub.sider.clear()
+    sider = les_sider('vegobjekter/445', {}, tolk, sjekkpunktmappe=str(tmp_path), api=stub.url)
+    # Dei to første sidene kjem frå sjekkpunktet, berre resten blir henta
+    assert stub.sider == [2 * SIDE, ANTALL]
+    assert ider(sider) == list(range(100000000, 100000000 + ANTALL))
+    assert not any(tmp_path.iterdir())
+
+
+def test_samtidige_nedlastingar_av_same_sporring(stub, tmp_path):
+    resultat, feil = [], []
+
+    def last():
+        try:
+            resultat.append(ider(les_sider('vegobjekter/445', {}, tolk, sjekkpunktmappe=str(tmp_path),
+                                           api=stub.url)))
+        except Exception as e:
+            feil.append(e)
+
+    traadar = [threading.Thread(target=last) for _ in range(4)]
+    for t in traadar:
+        t.start()
+    for t in traadar:
+        t.join()
+    assert not feil
+    assert resultat == [list(range(100000000, 100000000 + ANTALL))] * 4
+    assert not any(tmp_path.iterdir())
@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+from nvdbskred.vegreferanse import UKJEND_POSISJON, klargjer_vref, vegstrekning
+
+VREF = [
+    'EV39 S5D1 m100-200',
+    'EV39 S5D1 m300-400',
+    'EV39 S5D1 m450-600',
+    'EV39 S5D1 m250',
+    'EV39 S6D1 m10-20',
+    'EV39 S7D1 m50-90',
+    'EV39 S7D1 m50-150',
+    'EV39 S5D1',
+    'ugyldig',
+    None,
+    'RV39 S5D1 m300-400',
+]
+
+
+@pytest.fixture
+def df():
+    return klargjer_vref(pd.DataFrame({'vref': pd.array(VREF, dtype='string[pyarrow]'), 'rad': range(len(VREF))}))
+
+
+def vref(utval):
+    return sorted(utval['vref'])
+
+
+def test_sortert_og_ukjende_sist(df):
+    assert df['vegposisjon'].is_monotonic_increasing
+    # Utan meter eller med vref som ikkje kan tolkast, får raden ingen posisjon
+    ukjende = df[df['vegposisjon'] == UKJEND_POSISJON]
+    assert sorted(ukjende['rad']) == [7, 8, 9]
+
+
+def test_same_strekning(df):
+    assert vref(vegstrekning(df, 'Ev39', 5, 150, 5, 500)) == ['EV39 S5D1 m250', 'EV39 S5D1 m300-400']
+
+
+def test_fleire_strekningar(df):
+    assert vref(vegstrekning(df, 'Ev39', 5, 150, 7, 100)) == [
+        'EV39 S5D1 m250', 'EV39 S5D1 m300-400', 'EV39 S5D1 m450-600', 'EV39 S6D1 m10-20', 'EV39 S7D1 m50-90']
+
+
+def test_grensene_er_med(df):
+    assert vref(vegstrekning(df, 'EV39', 5, 100, 5, 200)) == ['EV39 S5D1 m100-200']
+
+
+def test_anna_veg(df):
+    assert vref(vegstrekning(df, 'Rv39', 1, 0, 9, 10000)) == ['RV39 S5D1 m300-400']
+    assert vegstrekning(df, 'Fv39', 1, 0, 9, 10000).empty
+
+
+def test_krev_vegnummer(df):
+    with pytest.raises(ValueError):
+        vegstrekning(df, 'Ev', 5, 0, 5, 100)
+
+
+def test_tolkar_ikkje_paa_nytt_utan_grunn(df):
+    assert klargjer_vref(df) is df
+
+
+def test_tolkar_paa_nytt_ved_manglande_posisjon(df):
+    # Rader utan vegposisjon, t.d. frå ein concat med rader som ikkje er klargjorde
+    ny = pd.concat([df, pd.DataFrame({'vref': pd.array(['EV39 S5D1 m350'], dtype='string[pyarrow]'), 'rad': [99]})],
+                   ignore_index=True)
+    ny = klargjer_vref(ny)
+    assert ny['vegposisjon'].dtype == 'int64'
+    assert 'EV39 S5D1 m350' in vref(vegstrekning(ny, 'Ev39', 5, 150, 5, 500))